@@ -0,0 +1,137 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Partition-based solver for very large TSP instances (tsp_33810_1, tsp_85900_1, ...).
+# 1. Karp partitioning: recursively cut the plane at the median of the longer side until every
+#    cluster has at most cluster_size cities.
+# 2. Order the clusters with a small TSP over their centroids.
+# 3. Solve every cluster as its own TSP on a process pool (the coordinates live in shared memory,
+#    tasks only carry index arrays).
+# 4. Stitch the sub-tours together in cluster order and run one neighbour-list 2-opt/Or-opt pass
+#    over the whole tour to clean up the seams.
+
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from ils import TourState, iterated_local_search, local_search
+from knn import build_knn, load_knn
+from distances import DistanceProvider
+from parallel_seeds import attach_shared_coords, create_shared_coords, nearest_neighbor_tour
+
+_worker = {} # per-process state filled in by _init_worker
+
+
+def karp_partition(coords, cluster_size):
+    # returns a list of index arrays, one per cluster
+    clusters = []
+    stack = [np.arange(len(coords))]
+    while stack:
+        indices = stack.pop()
+        if len(indices) <= cluster_size:
+            clusters.append(indices)
+            continue
+        sub = coords[indices]
+        axis = 0 if np.ptp(sub[:, 0]) >= np.ptp(sub[:, 1]) else 1
+        half = len(indices)//2
+        order = np.argpartition(sub[:, axis], half)
+        stack.append(indices[order[half:]])
+        stack.append(indices[order[:half]])
+    return clusters
+
+
+def order_clusters(coords, clusters):
+    # visiting order of the clusters from a quick tour over their centroids
+    centroids = np.array([coords[cluster].mean(axis=0) for cluster in clusters])
+    if len(clusters) < 4:
+        return list(range(len(clusters))), centroids
+    neighbors = build_knn(centroids, 8).tolist()
+    state = TourState(DistanceProvider(centroids), nearest_neighbor_tour(centroids, neighbors, 0), neighbors)
+    local_search(state)
+    return state.tour, centroids
+
+
+def _init_worker(shm_name, node_count):
+    shm, coords = attach_shared_coords(shm_name, node_count)
+    _worker['shm'] = shm # keep the block mapped for the life of the worker
+    _worker['coords'] = coords
+
+
+def _solve_cluster(task):
+    # solves one cluster as a closed tour and returns it in global node indices
+    cluster_id, indices, sub_time = task
+    sub = _worker['coords'][indices]
+    if len(indices) < 4:
+        return cluster_id, indices.tolist()
+    distances = DistanceProvider(sub)
+    neighbors = build_knn(sub, 8).tolist()
+    tour = nearest_neighbor_tour(sub, neighbors, 0)
+    if sub_time > 0:
+        tour, _ = iterated_local_search(distances, tour, sub_time, neighbors=neighbors, verbose=False)
+    else:
+        state = TourState(distances, tour, neighbors)
+        local_search(state)
+        tour = state.tour
+    return cluster_id, [int(indices[node]) for node in tour]
+
+
+def stitch(coords, sub_tours, cluster_order, centroids):
+    # joins the closed sub-tours into one tour: each cluster is entered at the node closest to
+    # where the previous one was left and walked in the direction that leaves it nearest to the next
+    def sq_dist(node, point):
+        return (coords[node, 0] - point[0])**2 + (coords[node, 1] - point[1])**2
+
+    tour = []
+    last_point = centroids[cluster_order[-1]]
+    for position, cluster_id in enumerate(cluster_order):
+        sub_tour = sub_tours[cluster_id]
+        next_point = centroids[cluster_order[(position + 1) % len(cluster_order)]]
+        entry = min(range(len(sub_tour)), key=lambda i: sq_dist(sub_tour[i], last_point))
+        forward = sub_tour[entry:] + sub_tour[:entry]
+        backward = [forward[0]] + forward[1:][::-1]
+        if sq_dist(backward[-1], next_point) < sq_dist(forward[-1], next_point):
+            forward = backward
+        tour.extend(forward)
+        last_point = coords[forward[-1]]
+    return tour
+
+
+def solve_by_decomposition(xs, ys, cluster_size=1000, processes=None, time_limit=None, sub_time=0, k=8, verbose=True):
+    # returns (tour, length)
+    # time_limit bounds the global clean-up pass; sub_time is the ILS budget per cluster (0 = local search only)
+    start_time = time.time()
+    node_count = len(xs)
+    shm, coords = create_shared_coords(xs, ys)
+    try:
+        clusters = karp_partition(coords, cluster_size)
+        cluster_order, centroids = order_clusters(coords, clusters)
+        if verbose:
+            print(f"Clusters: {len(clusters)} of at most {cluster_size} cities")
+
+        sub_tours = [None]*len(clusters)
+        tasks = [(cluster_id, indices, sub_time) for cluster_id, indices in enumerate(clusters)]
+        with mp.Pool(processes, initializer=_init_worker, initargs=(shm.name, node_count)) as pool:
+            for done, (cluster_id, sub_tour) in enumerate(pool.imap_unordered(_solve_cluster, tasks)):
+                sub_tours[cluster_id] = sub_tour
+                if verbose and (done + 1) % 10 == 0:
+                    print(f"Solved {done + 1} of {len(clusters)} clusters ({round(time.time() - start_time, 1)}s)")
+
+        tour = stitch(coords, sub_tours, cluster_order, centroids)
+    finally:
+        coords = None # drop the view before closing the block
+        shm.close()
+        shm.unlink()
+
+    points = list(zip(xs, ys))
+    knn = load_knn(points, k)
+    state = TourState(DistanceProvider(points, knn=knn), tour, knn.tolist())
+    if verbose:
+        print(f"Stitched tour: {round(state.length, 2)}")
+    deadline = None
+    if time_limit is not None:
+        deadline = start_time + time_limit
+    local_search(state, deadline=deadline)
+    if verbose:
+        print(f"After global 2-opt/Or-opt: {round(state.length, 2)} ({round(time.time() - start_time, 1)}s)")
+    return state.tour, state.length
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Distance provider shared by the routing move evaluators (the same file is in Wk4_tsp and Wk7_vrp).
+# dist(a, b) and row(a) are the whole API; how distances are stored depends on the mode:
+#   'full' - an n x n float32 matrix, only below full_threshold points (85,900^2 floats would be ~30 GB)
+#   'knn'  - only each point's k nearest distances are stored; other pairs are computed on the fly
+#   'lazy' - nothing is stored up front; dist(a, b) computes the whole row of a on a miss and keeps it
+#            in an LRU cache of at most cache_rows rows (moves look at many pairs around the same few
+#            points, so most lookups then hit a cached row)
+# Memory is therefore bounded by n^2 (small n), n*k or cache_rows*n floats.
+# Only the full matrix is float32; the other modes keep float64 so that a stored distance and the
+# same distance computed on the fly are identical (otherwise d(a, b) != d(b, a) and moves can cycle).
+
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+FULL_THRESHOLD = 4000 # 4000^2 float32 is 64 MB
+
+
+def full_matrix(coords, out=None):
+    # the n x n float32 matrix of the 'full' mode, written into out when given (e.g. shared memory)
+    coords = np.ascontiguousarray(coords, dtype=np.float64)
+    n = len(coords)
+    matrix = np.empty((n, n), dtype=np.float32) if out is None else out
+    for start in range(0, n, 1024): # chunked so the float64 temporaries stay small
+        diff = coords[start:start+1024, None, :] - coords[None, :, :]
+        matrix[start:start+1024] = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+    return matrix
+
+
+class DistanceProvider:
+    # matrix: a prebuilt full_matrix (for example one shared between processes); implies the 'full' mode
+    def __init__(self, coords, mode=None, full_threshold=FULL_THRESHOLD, knn=None, cache_rows=128, matrix=None):
+        self.coords = np.ascontiguousarray(coords, dtype=np.float64)
+        self.xs = self.coords[:, 0].tolist()
+        self.ys = self.coords[:, 1].tolist()
+        self.n = len(self.coords)
+        if mode is None and matrix is not None:
+            mode = 'full'
+        if mode is None:
+            mode = 'full' if self.n <= full_threshold else ('knn' if knn is not None else 'lazy')
+        self.mode = mode
+
+        if mode == 'full':
+            if matrix is None:
+                matrix = full_matrix(self.coords)
+            self.matrix = matrix
+            self.dist = matrix.item # item(a, b) returns a python float, much faster than matrix[a, b]
+        elif mode == 'knn':
+            if knn is None:
+                raise ValueError("knn mode needs the knn candidate array")
+            diff = self.coords[knn] - self.coords[:, None, :]
+            knn_dist = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+            self.near = [dict(zip(row, dists)) for row, dists in zip(knn.tolist(), knn_dist.tolist())]
+            self.dist = self.dist_knn
+        elif mode == 'lazy':
+            self.rows = OrderedDict()
+            self.cache_rows = cache_rows
+            self.dist = self.dist_lazy
+        else:
+            raise ValueError(f"unknown distance mode: {mode}")
+
+    def dist_exact(self, a, b):
+        return math.sqrt((self.xs[a] - self.xs[b])**2 + (self.ys[a] - self.ys[b])**2)
+
+    def dist_knn(self, a, b):
+        d = self.near[a].get(b)
+        if d is None:
+            return self.dist_exact(a, b)
+        return d
+
+    def dist_lazy(self, a, b):
+        rows = self.rows
+        row = rows.get(a)
+        if row is not None:
+            rows.move_to_end(a)
+            return row.item(b)
+        row = rows.get(b)
+        if row is not None:
+            rows.move_to_end(b)
+            return row.item(a)
+        return self.cached_row(a).item(b)
+
+    def compute_row(self, a):
+        diff = self.coords - self.coords[a]
+        return np.sqrt(np.einsum('ij,ij->i', diff, diff))
+
+    def cached_row(self, a):
+        # row a from the LRU cache, computed and added (evicting the least recently used row) on a miss
+        rows = self.rows
+        row = rows.get(a)
+        if row is not None:
+            rows.move_to_end(a)
+            return row
+        row = self.compute_row(a)
+        rows[a] = row
+        if len(rows) > self.cache_rows:
+            rows.popitem(last=False)
+        return row
+
+    def row(self, a):
+        # distances from a to every point
+        if self.mode == 'full':
+            return self.matrix[a]
+        if self.mode == 'lazy':
+            return self.cached_row(a)
+        return self.compute_row(a)
+
+    def tour_length(self, tour):
+        dist = self.dist
+        total = dist(tour[-1], tour[0])
+        for i in range(len(tour)-1):
+            total += dist(tour[i], tour[i+1])
+        return total
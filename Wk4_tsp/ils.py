@@ -0,0 +1,268 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Iterated local search for the TSP.
+# The tour is kept as a list of nodes plus a position list (pos[node] = index in tour) so that
+# succ/pred lookups are O(1). Local search is 2-opt + Or-opt restricted to each node's nearest
+# neighbours, driven by a queue of "don't-look bits": only nodes next to a changed edge are re-checked.
+# To escape local optima we apply a double-bridge kick inside a small window of the tour, re-optimize
+# around the kick, and accept or undo the result.
+
+import math
+import random
+import time
+from collections import deque
+
+from knn import load_knn
+
+EPS = 1e-9
+OR_OPT_MAX = 3 # longest segment moved by Or-opt
+
+
+class TourState:
+    # a tour that can be modified in place with 2-opt reversals and undone cheaply
+    # distances is a distances.DistanceProvider; every move is evaluated through its dist(a, b)
+    def __init__(self, distances, tour, neighbors):
+        self.distances = distances
+        self.dist = distances.dist
+        self.tour = list(tour)
+        self.n = len(tour)
+        self.pos = [0]*self.n
+        for index, node in enumerate(self.tour):
+            self.pos[node] = index
+        self.neighbors = neighbors
+        self.length = self.get_length()
+        self.journal = None # list of applied ops while a trial is open
+
+    def get_length(self):
+        return self.distances.tour_length(self.tour)
+
+    def succ(self, node):
+        return self.tour[(self.pos[node] + 1) % self.n]
+
+    def pred(self, node):
+        return self.tour[self.pos[node] - 1]
+
+    def reverse(self, i, j):
+        # reverses tour positions i..j inclusive, wrapping around the end of the list
+        # reversing the complement gives the same cycle, so always reverse the shorter side
+        n = self.n
+        seg_len = (j - i) % n + 1
+        if 2*seg_len > n:
+            i, j = (j+1) % n, (i-1) % n
+            seg_len = n - seg_len
+        if seg_len < 2:
+            return
+        if self.journal is not None:
+            self.journal.append(('r', i, j))
+        self.reverse_exact(i, j)
+
+    def move_2opt(self, a, b, c, d):
+        # removes edges (a,b),(c,d) and adds (a,c),(b,d)
+        # b and d must both be successors (or both predecessors) of a and c
+        if self.succ(a) == b:
+            self.reverse(self.pos[b], self.pos[c])
+        else:
+            self.reverse(self.pos[a], self.pos[d])
+
+    def move_or_opt(self, s1, se, c, e, reverse_segment):
+        # moves the segment s1..se (forward order) between c and e=succ(c), built from 2-opt moves
+        p = self.pred(s1)
+        nx = self.succ(se)
+        self.move_2opt(p, s1, c, e) # p c ... nx se..s1 e
+        if c != nx:
+            self.move_2opt(p, c, nx, se) # p nx ... c se..s1 e
+        if not reverse_segment:
+            self.move_2opt(c, se, s1, e) # c s1..se e
+
+    def kick(self, rng, window):
+        # double-bridge inside a window: s0 B C D -> s0 C B D, only the window is rewritten
+        # returns the endpoints of the changed edges so local search can start from them
+        n = self.n
+        window = min(window, n-2)
+        start = rng.randrange(n)
+        cut1, cut2 = sorted(rng.sample(range(1, window), 2))
+        span = [self.tour[(start + i) % n] for i in range(window)]
+        new_span = span[:1] + span[cut1+1:cut2+1] + span[1:cut1+1] + span[cut2+1:]
+        s0, b_first, b_last = span[0], span[1], span[cut1]
+        c_first, c_last = span[cut1+1], span[cut2]
+        d_first = span[cut2+1] if cut2+1 < window else self.tour[(start + window) % n]
+        dist = self.dist
+        self.length += (dist(s0, c_first) + dist(c_last, b_first) + dist(b_last, d_first)
+                        - dist(s0, b_first) - dist(b_last, c_first) - dist(c_last, d_first))
+        if self.journal is not None:
+            self.journal.append(('k', start, span))
+        self.write_span(start, new_span)
+        return [s0, b_first, b_last, c_first, c_last, d_first]
+
+    def write_span(self, start, span):
+        n = self.n
+        for i, node in enumerate(span):
+            index = (start + i) % n
+            self.tour[index] = node
+            self.pos[node] = index
+
+    def begin_trial(self):
+        self.journal = []
+        self.trial_length = self.length
+
+    def commit_trial(self):
+        self.journal = None
+
+    def undo_trial(self):
+        journal = self.journal
+        self.journal = None
+        for op in reversed(journal):
+            if op[0] == 'r':
+                self.reverse_exact(op[1], op[2])
+            else:
+                self.write_span(op[1], op[2])
+        self.length = self.trial_length
+
+    def reverse_exact(self, i, j):
+        # reverses exactly positions i..j; also used to undo a logged reversal
+        n = self.n
+        seg_len = (j - i) % n + 1
+        tour, pos = self.tour, self.pos
+        for _ in range(seg_len//2):
+            a, b = tour[i], tour[j]
+            tour[i], tour[j] = b, a
+            pos[b], pos[a] = i, j
+            i = (i+1) % n
+            j = (j-1) % n
+
+
+def improve_node(state, a):
+    # tries 2-opt and Or-opt moves starting at a; applies the first improving one
+    # returns the list of nodes whose edges changed, or None
+    dist = state.dist
+    for direction in (state.succ, state.pred):
+        b = direction(a)
+        d_ab = dist(a, b)
+        for c in state.neighbors[a]:
+            d_ac = dist(a, c)
+            if d_ac >= d_ab:
+                break # neighbours are sorted, nothing further can gain
+            d = direction(c)
+            if c == b or d == a:
+                continue
+            delta = d_ac + dist(b, d) - d_ab - dist(c, d)
+            if delta < -EPS:
+                state.move_2opt(a, b, c, d)
+                state.length += delta
+                return [a, b, c, d]
+
+    if state.n < 8:
+        return None
+    s1 = a
+    se = a
+    for seg_len in range(1, OR_OPT_MAX+1):
+        if seg_len > 1:
+            se = state.succ(se)
+        p = state.pred(s1)
+        nx = state.succ(se)
+        segment = set()
+        node = s1
+        while True:
+            segment.add(node)
+            if node == se:
+                break
+            node = state.succ(node)
+        if p in segment or nx in segment:
+            break
+        remove_gain = dist(p, s1) + dist(se, nx) - dist(p, nx)
+        if remove_gain <= EPS:
+            continue
+        for end in (s1, se):
+            for c in state.neighbors[end]:
+                if dist(c, end) >= remove_gain:
+                    break
+                if c in segment:
+                    continue
+                for c_left in (c, state.pred(c)):
+                    e = state.succ(c_left)
+                    if c_left in segment or e in segment or c_left == p:
+                        continue
+                    d_ce = dist(c_left, e)
+                    add_fwd = dist(c_left, s1) + dist(se, e) - d_ce
+                    add_rev = dist(c_left, se) + dist(s1, e) - d_ce
+                    reverse_segment = add_rev < add_fwd
+                    delta = min(add_fwd, add_rev) - remove_gain
+                    if delta < -EPS:
+                        state.move_or_opt(s1, se, c_left, e, reverse_segment)
+                        state.length += delta
+                        return [p, nx, s1, se, c_left, e]
+    return None
+
+
+def local_search(state, active=None, deadline=None):
+    # don't-look-bit driven descent; active is the list of nodes to start from (all nodes if None)
+    if active is None:
+        active = list(state.tour)
+    queue = deque(active)
+    queued = [False]*state.n
+    for node in active:
+        queued[node] = True
+    checks = 0
+    while queue:
+        a = queue.popleft()
+        queued[a] = False
+        changed = improve_node(state, a)
+        if changed:
+            for node in changed:
+                if not queued[node]:
+                    queued[node] = True
+                    queue.append(node)
+        checks += 1
+        if deadline is not None and checks % 256 == 0 and time.time() > deadline:
+            break
+    return state
+
+
+def iterated_local_search(distances, tour, time_limit, acceptance='better', neighbors=None, k=10, kick_window=50, seed=0, verbose=True):
+    # runs local search and then double-bridge kicks until time_limit seconds have passed
+    # acceptance: 'better' keeps only improving kicks, 'anneal' also accepts worse tours with a
+    # probability that shrinks as the budget runs out
+    start_time = time.time()
+    deadline = start_time + time_limit
+    rng = random.Random(seed)
+    if neighbors is None:
+        neighbors = load_knn(distances.coords, k).tolist()
+    state = TourState(distances, tour, neighbors)
+    if state.n < 8:
+        return state.tour, state.length
+
+    local_search(state, deadline=deadline)
+    best_tour = list(state.tour)
+    best_length = state.length
+    if verbose:
+        print(f"ILS start: {round(best_length, 2)}")
+
+    temperature0 = 0.1 * best_length/state.n # about a tenth of an average edge
+    iteration = 0
+    while time.time() < deadline:
+        iteration += 1
+        state.begin_trial()
+        active = state.kick(rng, kick_window)
+        local_search(state, active)
+        delta = state.length - state.trial_length
+
+        accept = delta < -EPS
+        if not accept and acceptance == 'anneal' and delta > EPS:
+            remaining = max(deadline - time.time(), 0)/time_limit
+            temperature = temperature0 * remaining
+            accept = temperature > 0 and rng.random() < math.exp(-delta/temperature)
+        if accept:
+            state.commit_trial()
+        else:
+            state.undo_trial()
+
+        if state.length < best_length - EPS:
+            best_length = state.length
+            best_tour = list(state.tour)
+            if verbose and iteration % 100 == 0:
+                print(f"ILS iteration {iteration}: {round(best_length, 2)}")
+
+    if verbose:
+        print(f"ILS finished after {iteration} kicks: {round(best_length, 2)}")
+    return best_tour, best_length
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Builds greedy tours from many seeds at once on a process pool.
+# The parent builds the knn candidate lists once, and the coordinates, the knn array and (below the
+# full matrix threshold of distances.py) the distance matrix are placed in shared memory blocks;
+# workers attach to them in their initializer instead of each building or receiving a private copy.
+# Each task only sends a seed and returns (length, tour).
+
+import multiprocessing as mp
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ils import TourState, local_search
+from knn import load_knn
+from distances import FULL_THRESHOLD, DistanceProvider, full_matrix
+
+_worker = {} # per-process state filled in by _init_worker
+
+
+def create_shared_array(shape, dtype):
+    # a new zeroed array in a shared memory block; the caller must close() and unlink() the block
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape))*np.dtype(dtype).itemsize, 1))
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def attach_shared_array(shm_name, shape, dtype):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def create_shared_coords(xs, ys):
+    # copies the coordinates into a new shared memory block; the caller must close() and unlink() it
+    shm, coords = create_shared_array((len(xs), 2), np.float64)
+    coords[:, 0] = xs
+    coords[:, 1] = ys
+    return shm, coords
+
+
+def attach_shared_coords(shm_name, node_count):
+    return attach_shared_array(shm_name, (node_count, 2), np.float64)
+
+
+def _init_worker(shm_names, node_count, k):
+    coords_name, knn_name, matrix_name = shm_names
+    shm, coords = attach_shared_coords(coords_name, node_count)
+    knn_shm, knn = attach_shared_array(knn_name, (node_count, k), np.int32)
+    blocks = [shm, knn_shm] # keep the blocks mapped for the life of the worker
+    matrix = None
+    if matrix_name is not None:
+        matrix_shm, matrix = attach_shared_array(matrix_name, (node_count, node_count), np.float32)
+        blocks.append(matrix_shm)
+    _worker['shm'] = blocks
+    _worker['coords'] = coords
+    _worker['distances'] = DistanceProvider(coords, knn=knn, matrix=matrix)
+    _worker['neighbors'] = knn.tolist()
+
+
+def nearest_neighbor_tour(coords, neighbors, seed):
+    # greedy tour from seed; checks the neighbour list first and only falls back to a full scan
+    # of the unvisited nodes when all neighbours are already taken
+    node_count = len(coords)
+    visited = np.zeros(node_count, dtype=bool)
+    tour = [seed]
+    visited[seed] = True
+    current = seed
+    for _ in range(node_count-1):
+        next_node = -1
+        for other in neighbors[current]:
+            if not visited[other]:
+                next_node = other
+                break
+        if next_node == -1:
+            unvisited = np.flatnonzero(~visited)
+            diff = coords[unvisited] - coords[current]
+            next_node = int(unvisited[np.argmin(np.einsum('ij,ij->i', diff, diff))])
+        tour.append(next_node)
+        visited[next_node] = True
+        current = next_node
+    return tour
+
+
+def _solve_seed(seed):
+    tour = nearest_neighbor_tour(_worker['coords'], _worker['neighbors'], seed)
+    state = TourState(_worker['distances'], tour, _worker['neighbors'])
+    local_search(state)
+    return state.length, state.tour, seed
+
+
+def run_seeds(xs, ys, seeds, processes=None, target=None, k=10, verbose=True, deadline=None):
+    # returns (best_tour, best_length) over all seeds
+    # stops early once a tour of length <= target is found, or at the deadline (a time.time() value)
+    # once at least one seed has finished
+    node_count = len(xs)
+    shm, coords = create_shared_coords(xs, ys)
+    knn = load_knn(coords, k) # once here, so the workers neither rebuild it nor race on the cache file
+    k = knn.shape[1]
+    knn_shm, shared_knn = create_shared_array(knn.shape, np.int32)
+    shared_knn[:] = knn
+    blocks = [shm, knn_shm]
+    matrix_name = None
+    if node_count <= FULL_THRESHOLD:
+        matrix_shm, matrix = create_shared_array((node_count, node_count), np.float32)
+        full_matrix(coords, out=matrix)
+        blocks.append(matrix_shm)
+        matrix_name = matrix_shm.name
+    try:
+        best_tour = None
+        best_length = float('inf')
+        pool = mp.Pool(processes, initializer=_init_worker,
+                       initargs=((shm.name, knn_shm.name, matrix_name), node_count, k))
+        try:
+            for length, tour, seed in pool.imap_unordered(_solve_seed, seeds):
+                if verbose:
+                    print(f"Seed {seed}: {round(length, 2)}")
+                if length < best_length:
+                    best_length = length
+                    best_tour = tour
+                    if verbose:
+                        print("NEW BEST")
+                if target is not None and best_length <= target:
+                    if verbose:
+                        print(f"Target {target} reached, stopping early")
+                    break
+                if deadline is not None and time.time() > deadline:
+                    if verbose:
+                        print("Seed deadline reached, stopping early")
+                    break
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        coords = shared_knn = matrix = None # drop the views before closing the blocks
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return best_tour, best_length
@@ -1,24 +1,27 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import math
+import time
 from collections import namedtuple
+from ils import iterated_local_search
+from parallel_seeds import run_seeds
+from decompose import solve_by_decomposition
+from distances import DistanceProvider
+from knn import load_knn
 
 Point = namedtuple("Point", ['x', 'y'])
 
-def length(point1, point2):
-    return math.sqrt((point1.x - point2.x)**2 + (point1.y - point2.y)**2)
-
-def find_closest_not_assigned(points, unassigned, last_point): # finds the closest unassigned node to the last node in the solution
-    
+def find_closest_not_assigned(points, distances, unassigned, last): # finds the closest unassigned node to the last node in the solution
+    # distances is a distances.DistanceProvider, as for every other distance in the solver
+    last_point = points[last]
     close_node = unassigned[0]
     close_diff_x = abs(last_point.x - points[close_node].x)
     close_diff_y = abs(last_point.y - points[close_node].y)
-    min_distance = length(last_point, points[close_node])
+    min_distance = distances.dist(last, close_node)
     
     for i in unassigned:
         if abs(points[i].x - last_point.x) < close_diff_x or abs(points[i].y - last_point.y) < close_diff_y:
-            distance = length(last_point, points[i])
+            distance = distances.dist(last, i)
             if distance < min_distance:
                 close_node = i
                 min_distance = distance
@@ -27,17 +30,12 @@ def find_closest_not_assigned(points, unassigned, last_point): # finds the close
 
     return close_node
 
-def get_total_length(points, path):
+def get_total_length(distances, path):
     if len(path) < 2:
         return 0
-    else:
-        total_length = length(points[path[-1]], points[path[0]])
-    if len(path) > 2:
-        for index in range(0, len(path)-1):
-            total_length += length(points[path[index]], points[path[index+1]])
-    return total_length
+    return distances.tour_length(path)
 
-def is_better(points, best, contender):
+def is_better(distances, best, contender):
     # returns 1 if the contender solution is better than the best solution, 0 otherwise
     while best[0] == contender[0] and len(best) > 1:
         best = best[1:]
@@ -46,19 +44,19 @@ def is_better(points, best, contender):
         best = best[:-1]
         contender = contender[:-1]
 
-    best_total_length = get_total_length(points, best)
-    contender_total_length = get_total_length(points, contender)
+    best_total_length = get_total_length(distances, best)
+    contender_total_length = get_total_length(distances, contender)
     if contender_total_length < best_total_length: # lower is better
         return 1
     else:
         return 0
 
-def opt2(points, solution):
+def opt2(distances, solution):
     # tries all swaps on the solution
     # not guaranteed to get the global optimum with a single call
-    best_total_length = get_total_length(points, solution)
+    best_total_length = get_total_length(distances, solution)
     for i in range(len(solution)-1):
-        if length(points[solution[i]],points[solution[i+1]]) < best_total_length/(len(solution)*2):
+        if distances.dist(solution[i], solution[i+1]) < best_total_length/(len(solution)*2):
             # arbitrary but helps skip over edges that are already very short
             pass
         else:
@@ -66,7 +64,7 @@ def opt2(points, solution):
                 swap = solution[i:k]
                 swap.reverse()
                 test_solution = solution[:i] + swap + solution[k:]
-                test_total_length = get_total_length(points, test_solution)
+                test_total_length = get_total_length(distances, test_solution)
                 if test_total_length < best_total_length:
                     if len(solution) >= 574:
                         print(i, best_total_length, test_total_length - best_total_length)
@@ -75,17 +73,23 @@ def opt2(points, solution):
     return solution
 
 
-def get_greedy_from_seedy(points, seed):
+def get_greedy_from_seedy(points, distances, seed):
     unassigned = list(set(range(len(points))) - set(seed))
     while len(seed) < len(points):
-        last_point = points[seed[-1]]
-        next_point = find_closest_not_assigned(points, unassigned, last_point)
+        next_point = find_closest_not_assigned(points, distances, unassigned, seed[-1])
         seed.append(next_point)
         unassigned.remove(next_point)
     return seed
 
-def solve_it(input_data):
+def solve_it(input_data, time_limit=None, acceptance='better', processes=None, target=None, decompose=None, cluster_size=1000):
     # Modify this code to run your optimization algorithm
+    # time_limit: wall-clock seconds; when given, any time left after construction is spent on iterated local search
+    # acceptance: 'better' or 'anneal', see ils.iterated_local_search
+    # processes: when given, seed tours are built and 2-opted in parallel on that many worker processes
+    # target: tour length at which the parallel seed search stops early
+    # decompose: split the plane into clusters of at most cluster_size cities and solve them separately;
+    # defaults to on for the very large instances
+    start_time = time.time()
 
     # parse the input
     lines = input_data.split('\n')
@@ -105,6 +109,11 @@ def solve_it(input_data):
 
     avg_point = Point(x_avg, y_avg)
 
+    # every distance goes through one provider (distances.py): a full matrix for the smaller
+    # instances, the k nearest distances per city above that
+    knn = load_knn(points, 10)
+    distances = DistanceProvider(points, knn=knn)
+
 # greedy + 2-opt results (low quality, high quality):
 # 1. 448 (482, 430),
 # 2. 23097 (23433, 20800)
@@ -114,7 +123,7 @@ def solve_it(input_data):
 # 6. 78.4M (78.5M, 67.7M)
 
     solution = list(range(0,nodeCount)) # trivial; this is actually the best for tc_574_1
-    best_total_length = get_total_length(points, solution)
+    best_total_length = get_total_length(distances, solution)
 
     print(f"Points: {nodeCount}")
     print(f"Average Point: {x_avg}, {y_avg}")
@@ -128,32 +137,61 @@ def solve_it(input_data):
     if nodeCount >= max_nodes:
         step = 10000
 
+    if decompose is None:
+        decompose = nodeCount >= max_nodes
+
+    # with a time limit the seeds get a fifth of it and the O(n^3) opt2 passes are skipped; the
+    # neighbour-list local search of the ILS replaces them
+    deadline = None
+    if time_limit is not None:
+        deadline = start_time + 0.2*time_limit
+
     print(f"Step: {step}")
-    for seed in range(0,nodeCount,step):
-        if nodeCount >= max_nodes:
-            print(f"Starting seed: {seed}")
-        solution_seed = get_greedy_from_seedy(points, [seed])
-        if nodeCount < threshold:
-            solution_seed = opt2(points, solution_seed)
-        test_length = get_total_length(points, solution_seed)
-        print(f"Seed {seed}: {round(test_length,2)}")
+    if decompose:
+        xs = [point.x for point in points]
+        ys = [point.y for point in points]
+        solution, best_total_length = solve_by_decomposition(xs, ys, cluster_size, processes, time_limit)
+    elif processes is not None:
+        xs = [point.x for point in points]
+        ys = [point.y for point in points]
+        solution_seed, test_length = run_seeds(xs, ys, range(0,nodeCount,step), processes, target, deadline=deadline)
         if test_length < best_total_length:
-            solution = list(solution_seed)
+            solution = solution_seed
             best_total_length = test_length
-            print("NEW BEST")
+    else:
+        for seed in range(0,nodeCount,step):
+            if deadline is not None and time.time() > deadline and seed > 0:
+                print("Seed deadline reached")
+                break
+            if nodeCount >= max_nodes:
+                print(f"Starting seed: {seed}")
+            solution_seed = get_greedy_from_seedy(points, distances, [seed])
+            if nodeCount < threshold and time_limit is None:
+                solution_seed = opt2(distances, solution_seed)
+            test_length = get_total_length(distances, solution_seed)
+            print(f"Seed {seed}: {round(test_length,2)}")
+            if test_length < best_total_length:
+                solution = list(solution_seed)
+                best_total_length = test_length
+                print("NEW BEST")
 
     print(f"Best Path Length from greedy: {best_total_length}")
 
 
-    for i in range(0,threshold,int(nodeCount/2)):
-        print("Starting 2-opt again...")
-        solution = opt2(points, solution)
+    if not decompose and time_limit is None:
+        for i in range(0,threshold,int(nodeCount/2)):
+            print("Starting 2-opt again...")
+            solution = opt2(distances, solution)
+
+    if time_limit is not None:
+        time_left = time_limit - (time.time() - start_time)
+        if time_left > 0:
+            print(f"Starting Iterated Local Search ({round(time_left, 1)}s)...")
+            solution, _ = iterated_local_search(distances, solution, time_left, acceptance=acceptance, neighbors=knn.tolist())
 
     print("Solution Found:")
     # calculate the length of the tour
-    obj = length(points[solution[-1]], points[solution[0]])
-    for index in range(0, nodeCount-1):
-        obj += length(points[solution[index]], points[solution[index+1]])
+    obj = get_total_length(distances, solution)
 
     # prepare the solution in the specified output format
     output_data = '%.2f' % obj + ' ' + str(0) + '\n'
@@ -169,7 +207,8 @@ if __name__ == '__main__':
         file_location = sys.argv[1].strip()
         with open(file_location, 'r') as input_data_file:
             input_data = input_data_file.read()
-        print(solve_it(input_data))
+        time_limit = float(sys.argv[2]) if len(sys.argv) > 2 else None
+        print(solve_it(input_data, time_limit))
     else:
-        print('This test requires an input file.  Please select one from the data directory. (i.e. python solver.py ./data/tsp_51_1)')
+        print('This test requires an input file.  Please select one from the data directory. (i.e. python solver.py ./data/tsp_51_1 [seconds])')
 
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Incrementally costed facility location solution.
+# FacilitySolution keeps the assignment together with the total cost, the load and assigned count of
+# every facility, the open flags and the customers of every facility. assign/unassign/move update all
+# of them in O(1) from the distance table, so the greedy and the local search never re-sum a solution.
+# Customers may be unassigned (-1) while a solution is being built; they add nothing to the cost.
+# With debug=True every operation is followed by check(), which rebuilds everything from scratch.
+# get_cost totals a complete assignment in one vectorized pass, for code that only needs the cost of
+# a finished solution (the LNS sub-problems) rather than a solution to modify.
+
+import numpy as np
+
+
+def get_cost(distance_table, setup_costs, solution):
+    solution = np.asarray(solution)
+    return float(setup_costs[np.unique(solution)].sum() + distance_table[solution, np.arange(len(solution))].sum())
+
+
+class FacilitySolution:
+    def __init__(self, distance_table, setup_costs, capacities, demands, solution=None, debug=False):
+        self.dist = distance_table.item # dist(f, c) as a python float
+        self.setup = np.asarray(setup_costs, dtype=np.float64).tolist() # python scalars, cheaper in the move loops
+        self.cap = np.asarray(capacities).tolist()
+        self.demand = np.asarray(demands).tolist()
+        self.debug = debug
+        self.solution = [-1]*len(self.demand)
+        self.load = [0]*len(self.setup)
+        self.count = [0]*len(self.setup) # customers assigned to each f
+        self.is_open = [False]*len(self.setup)
+        self.members = [set() for f in self.setup]
+        self.cost = 0
+        if solution is not None:
+            for c, f in enumerate(solution):
+                if f >= 0:
+                    self.assign(c, f)
+
+    def assign(self, c, f):
+        # assigns an unassigned c to f; the caller has checked capacity
+        self.solution[c] = f
+        self.load[f] += self.demand[c]
+        self.count[f] += 1
+        self.members[f].add(c)
+        self.cost += self.dist(f, c)
+        if self.count[f] == 1:
+            self.is_open[f] = True
+            self.cost += self.setup[f]
+        if self.debug:
+            self.check()
+
+    def unassign(self, c):
+        f = self.solution[c]
+        self.solution[c] = -1
+        self.load[f] -= self.demand[c]
+        self.count[f] -= 1
+        self.members[f].discard(c)
+        self.cost -= self.dist(f, c)
+        if self.count[f] == 0:
+            self.is_open[f] = False
+            self.cost -= self.setup[f]
+        if self.debug:
+            self.check()
+
+    def move(self, c, g):
+        # reassigns c to g and updates the aggregates; the caller has checked capacity
+        f = self.solution[c]
+        self.cost += self.reassign_delta(c, g)
+        self.load[f] -= self.demand[c]
+        self.load[g] += self.demand[c]
+        self.count[f] -= 1
+        self.count[g] += 1
+        self.is_open[f] = self.count[f] > 0
+        self.is_open[g] = True
+        self.members[f].discard(c)
+        self.members[g].add(c)
+        self.solution[c] = g
+        if self.debug:
+            self.check()
+
+    def reassign_delta(self, c, g):
+        f = self.solution[c]
+        delta = self.dist(g, c) - self.dist(f, c)
+        if not self.count[g]:
+            delta += self.setup[g]
+        if self.count[f] == 1:
+            delta -= self.setup[f]
+        return delta
+
+    def fits(self, f, extra):
+        return self.load[f] + extra <= self.cap[f]
+
+    def open_count(self):
+        return sum(self.is_open)
+
+    def check(self, tolerance=1e-6):
+        # recomputes every aggregate from the assignment and raises AssertionError on a mismatch
+        load = [0]*len(self.setup)
+        count = [0]*len(self.setup)
+        cost = 0
+        for c, f in enumerate(self.solution):
+            if f >= 0:
+                load[f] += self.demand[c]
+                count[f] += 1
+                cost += self.dist(f, c)
+                assert c in self.members[f], f"customer {c} missing from the members of facility {f}"
+        for f in range(len(self.setup)):
+            assert load[f] == self.load[f], f"facility {f}: load {self.load[f]}, expected {load[f]}"
+            assert count[f] == self.count[f] == len(self.members[f]), f"facility {f}: count {self.count[f]}, expected {count[f]}"
+            assert self.is_open[f] == (count[f] > 0), f"facility {f}: open flag {self.is_open[f]}"
+            if count[f]:
+                cost += self.setup[f]
+        assert abs(cost - self.cost) <= tolerance*max(1, abs(cost)), f"cost {self.cost}, expected {cost}"
+        return True
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Struct-of-arrays model of a facility location instance.
+# Each attribute is one contiguous numpy array indexed by facility or by customer, so the distance
+# table, the greedy and the search modules all read the same arrays instead of lists of namedtuples.
+# FacilityView and CustomerView give f.setup_cost / c.demand style access to a single entry where
+# that reads better (printing, debugging); they hold only the instance and an index.
+
+import numpy as np
+
+
+class FacilityInstance:
+    def __init__(self, setup_cost, capacity, facility_x, facility_y, demand, customer_x, customer_y):
+        self.setup_cost = np.ascontiguousarray(setup_cost, dtype=np.float64)
+        self.capacity = np.ascontiguousarray(capacity, dtype=np.int64)
+        self.facility_x = np.ascontiguousarray(facility_x, dtype=np.float64)
+        self.facility_y = np.ascontiguousarray(facility_y, dtype=np.float64)
+        self.demand = np.ascontiguousarray(demand, dtype=np.int64)
+        self.customer_x = np.ascontiguousarray(customer_x, dtype=np.float64)
+        self.customer_y = np.ascontiguousarray(customer_y, dtype=np.float64)
+
+    @classmethod
+    def parse(cls, input_data):
+        # first line "F C", then F lines "setup capacity x y", then C lines "demand x y"
+        lines = input_data.split('\n')
+        parts = lines[0].split()
+        facility_count = int(parts[0])
+        customer_count = int(parts[1])
+        facility_rows = np.array([lines[i].split()[:4] for i in range(1, facility_count+1)], dtype=np.float64).reshape(-1, 4)
+        customer_rows = np.array([lines[i].split()[:3] for i in range(facility_count+1, facility_count+1+customer_count)],
+                                 dtype=np.float64).reshape(-1, 3)
+        return cls(facility_rows[:, 0], facility_rows[:, 1], facility_rows[:, 2], facility_rows[:, 3],
+                   customer_rows[:, 0], customer_rows[:, 1], customer_rows[:, 2])
+
+    @property
+    def facility_count(self):
+        return len(self.setup_cost)
+
+    @property
+    def customer_count(self):
+        return len(self.demand)
+
+    @property
+    def facility_xy(self):
+        return np.column_stack((self.facility_x, self.facility_y))
+
+    @property
+    def customer_xy(self):
+        return np.column_stack((self.customer_x, self.customer_y))
+
+    def facility(self, f):
+        return FacilityView(self, f)
+
+    def customer(self, c):
+        return CustomerView(self, c)
+
+    def facilities(self):
+        return [FacilityView(self, f) for f in range(self.facility_count)]
+
+    def customers(self):
+        return [CustomerView(self, c) for c in range(self.customer_count)]
+
+
+class FacilityView:
+    __slots__ = ('instance', 'index')
+
+    def __init__(self, instance, index):
+        self.instance = instance
+        self.index = index
+
+    @property
+    def setup_cost(self):
+        return float(self.instance.setup_cost[self.index])
+
+    @property
+    def capacity(self):
+        return int(self.instance.capacity[self.index])
+
+    @property
+    def location(self):
+        return float(self.instance.facility_x[self.index]), float(self.instance.facility_y[self.index])
+
+    def __repr__(self):
+        return f"Facility(index={self.index}, setup_cost={self.setup_cost}, capacity={self.capacity}, location={self.location})"
+
+
+class CustomerView:
+    __slots__ = ('instance', 'index')
+
+    def __init__(self, instance, index):
+        self.instance = instance
+        self.index = index
+
+    @property
+    def demand(self):
+        return int(self.instance.demand[self.index])
+
+    @property
+    def location(self):
+        return float(self.instance.customer_x[self.index]), float(self.instance.customer_y[self.index])
+
+    def __repr__(self):
+        return f"Customer(index={self.index}, demand={self.demand}, location={self.location})"
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Lagrangian relaxation of capacitated facility location, for a lower bound and a quick heuristic.
+# The "every customer is served once" constraints are moved into the objective with multipliers lam_c:
+#   L(lam) = sum_c lam_c + sum_f min(0, setup_f + K_f(lam))
+#   K_f(lam) = min sum_c (dist_fc - lam_c) x_fc  s.t.  sum_c demand_c x_fc <= cap_f,  0 <= x_fc <= 1
+# K_f is a knapsack over the customers with negative reduced cost; we solve its LP relaxation, which
+# is a greedy by cost/demand ratio and keeps L(lam) a valid lower bound. All facilities are solved at
+# once in vectorized form over the (usually few) negative entries of the reduced cost matrix.
+# Subgradient optimization moves lam towards a tighter bound, and every few iterations the facilities
+# the relaxation opens are repaired into a feasible solution; the best repair is polished by local search.
+
+import time
+
+import numpy as np
+
+from facility_solution import FacilitySolution
+from local_search import local_search
+from spatial import nearest_facilities
+
+
+def solve_subproblems(distance_table, lam, setup_costs, capacities, demands):
+    # returns (bound, open flags, how much of each customer the open facilities take)
+    facility_count, customer_count = distance_table.shape
+    fi, ci = np.nonzero(distance_table < lam[None, :])
+    reduced = distance_table[fi, ci] - lam[ci]
+    weight = demands[ci]
+    order = np.lexsort((reduced/weight, fi)) # by facility, then most negative cost per unit of demand
+    fi, ci, reduced, weight = fi[order], ci[order], reduced[order], weight[order]
+    used_before = np.cumsum(weight) - weight
+    group_start = np.searchsorted(fi, fi, 'left')
+    used_before -= used_before[group_start] # demand already packed into the same facility
+    x = np.clip((capacities[fi] - used_before)/weight, 0, 1)
+    knapsack = np.bincount(fi, weights=x*reduced, minlength=facility_count)
+    value = setup_costs + knapsack
+    is_open = value < 0
+    bound = lam.sum() + value[is_open].sum()
+    served = np.bincount(ci, weights=x*is_open[fi], minlength=customer_count)
+    return bound, is_open, served
+
+
+def repair(distance_table, customer_facilities, setup_costs, capacities, demands, is_open):
+    # assigns customers, largest demand first, to the nearest open facility with room
+    # (its near facilities first, then all open ones); when none has room the cheapest closed facility that fits is opened
+    # returns (solution, cost) with the cost kept incrementally by a FacilitySolution, or None
+    is_open = is_open.copy()
+    room = capacities.astype(np.float64)
+    state = FacilitySolution(distance_table, setup_costs, capacities, demands)
+    for c in np.argsort(-demands, kind='stable').tolist():
+        d = demands[c]
+        for f in customer_facilities[c]:
+            if is_open[f] and room[f] >= d:
+                break
+        else:
+            fits = np.flatnonzero(is_open & (room >= d))
+            if len(fits) > 0:
+                f = int(fits[np.argmin(distance_table[fits, c])])
+            else:
+                fits = np.flatnonzero(room >= d)
+                if len(fits) == 0:
+                    return None
+                f = int(fits[np.argmin(setup_costs[fits] + distance_table[fits, c])])
+                is_open[f] = True
+        state.assign(c, int(f))
+        room[f] -= d
+    return state.solution, state.cost
+
+
+def lagrangian_relaxation(distance_table, setup_costs, capacities, demands, solution=None, time_limit=30,
+                          max_iterations=1000, repair_every=10, verbose=True):
+    # returns (best solution, its cost, best lower bound)
+    start_time = time.time()
+    setup_costs = np.asarray(setup_costs, dtype=np.float64)
+    capacities = np.asarray(capacities, dtype=np.float64)
+    demands = np.asarray(demands, dtype=np.float64)
+    customer_facilities = nearest_facilities(distance_table, 20).tolist()
+
+    best_solution = solution
+    upper = float('inf')
+    if solution is not None:
+        upper = FacilitySolution(distance_table, setup_costs, capacities, demands, solution).cost
+    best_repair = None
+    best_repair_cost = float('inf')
+    lam = np.sort(distance_table, axis=0)[min(1, len(setup_costs)-1)].astype(np.float64) # second nearest facility
+    lower = -float('inf')
+    theta = 2.0
+    stall = 0
+    for iteration in range(1, max_iterations+1):
+        bound, is_open, served = solve_subproblems(distance_table, lam, setup_costs, capacities, demands)
+        if bound > lower + 1e-9:
+            lower = bound
+            stall = 0
+        else:
+            stall += 1
+            if stall >= 20:
+                theta /= 2
+                stall = 0
+
+        if iteration % repair_every == 1 or best_solution is None:
+            repaired = repair(distance_table, customer_facilities, setup_costs, capacities, demands, is_open)
+            if repaired is not None:
+                candidate, cost = repaired
+                if cost < best_repair_cost:
+                    best_repair_cost = cost
+                    best_repair = candidate
+                if cost < upper:
+                    upper = cost
+                    best_solution = candidate
+
+        subgradient = 1 - served
+        norm = float(subgradient @ subgradient)
+        if norm < 1e-12 or theta < 1e-4 or time.time() - start_time > time_limit:
+            break
+        target = upper if upper < float('inf') else 1.05*abs(bound)
+        lam += theta*(target - bound)/norm*subgradient
+
+        if verbose and iteration % 50 == 0:
+            print(f"Lagrangian iteration {iteration}: bound {round(lower, 2)}, best {round(upper, 2)}")
+
+    if best_repair is not None:
+        polished, cost = local_search(distance_table, setup_costs, capacities, demands, best_repair,
+                                      max(0.25*time_limit, 1), verbose=False)
+        if cost < upper - 1e-6:
+            upper = cost
+            best_solution = polished
+
+    if verbose:
+        print(f"Lagrangian: bound {round(lower, 2)}, best {round(upper, 2)}, gap {round(100*(upper - lower)/max(upper, 1e-9), 2)}% ({iteration} iterations, {round(time.time() - start_time, 1)}s)")
+    return best_solution, upper, lower
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Large neighbourhood search for the big facility instances (500x3000, 1000x1500, 2000x2000),
+# where a MIP over the whole model is too large.
+# Each round picks a few spatial regions (a facility and its nearest facilities, plus every customer
+# currently served by them), freezes the rest of the solution, and re-optimizes every region exactly
+# with the sub-MIP from mip.py. Without a MIP solver the region is perturbed instead: a random half
+# of its open facilities is closed, its customers are re-assigned by the repair of lagrangian.py and
+# local_search.py descends from there (starting from the current assignment, which is already a local
+# optimum, it would hardly ever improve).
+# Regions in the same round share no facilities, so they are independent and solved on a process pool.
+# Every accepted improvement is logged as (seconds, cost) in the returned history.
+
+import multiprocessing as mp
+import random
+import time
+
+import numpy as np
+
+from facility_solution import get_cost
+from lagrangian import repair
+from local_search import local_search
+from mip import mip_available, solve_mip
+from spatial import facility_neighbors, nearest_facilities
+
+
+def pick_regions(rng, solution, near_facilities, region_size, region_count):
+    # seeds are open facilities; a region is the seed's region_size nearest facilities
+    open_facilities = sorted(set(solution))
+    rng.shuffle(open_facilities)
+    taken = set()
+    regions = []
+    for seed in open_facilities:
+        region = near_facilities[seed][:region_size]
+        if taken.isdisjoint(region):
+            regions.append(region)
+            taken.update(region)
+            if len(regions) == region_count:
+                break
+    return regions
+
+
+def build_task(distance_table, setup_costs, capacities, demands, solution, region, sub_time, k, seed):
+    # the sub-problem only sees the region's facilities and the customers they currently serve
+    region = np.asarray(region)
+    position = {f: i for i, f in enumerate(region.tolist())}
+    region_customers = np.flatnonzero(np.isin(solution, region))
+    sub_table = distance_table[np.ix_(region, region_customers)]
+    warm = [position[solution[c]] for c in region_customers.tolist()]
+    return (region, region_customers, sub_table, setup_costs[region], capacities[region],
+            demands[region_customers], warm, sub_time, k, seed)
+
+
+def perturb(sub_table, setups, caps, demands, warm, k, rng):
+    # closes a random half (at least one) of the region's open facilities and re-assigns the customers
+    opened = sorted(set(warm))
+    is_open = np.zeros(len(setups), dtype=bool)
+    is_open[opened] = True
+    is_open[rng.sample(opened, max(1, len(opened)//2))] = False
+    customer_facilities = nearest_facilities(sub_table, min(k, len(setups))).tolist()
+    repaired = repair(sub_table, customer_facilities, np.asarray(setups, dtype=np.float64),
+                      np.asarray(caps, dtype=np.float64), np.asarray(demands, dtype=np.float64), is_open)
+    return warm if repaired is None else repaired[0]
+
+
+def _solve_region(task):
+    region, region_customers, sub_table, setups, caps, demands, warm, sub_time, k, seed = task
+    if len(region_customers) == 0:
+        return region, region_customers, warm, 0.0
+    if mip_available():
+        result = solve_mip(sub_table, setups, caps, demands, warm, sub_time, min(k, len(region)), verbose=False)
+        if result is not None:
+            return region, region_customers, result[0], get_cost(sub_table, setups, warm) - get_cost(sub_table, setups, result[0])
+    start = perturb(sub_table, setups, caps, demands, warm, k, random.Random(seed))
+    sub_solution, _ = local_search(sub_table, setups, caps, demands, start, sub_time, verbose=False)
+    return region, region_customers, sub_solution, get_cost(sub_table, setups, warm) - get_cost(sub_table, setups, sub_solution)
+
+
+def large_neighborhood_search(distance_table, facility_xy, setup_costs, capacities, demands, solution, time_limit,
+                              region_size=20, sub_time=10, k=10, processes=None, seed=0, verbose=True):
+    # returns (solution, cost, history)
+    start_time = time.time()
+    deadline = start_time + time_limit
+    rng = random.Random(seed)
+    setup_costs = np.asarray(setup_costs, dtype=np.float64)
+    capacities = np.asarray(capacities)
+    demands = np.asarray(demands)
+    solution = list(solution)
+    cost = get_cost(distance_table, setup_costs, solution)
+    history = [(0.0, cost)]
+
+    near_facilities = facility_neighbors(facility_xy, region_size).tolist()
+    processes = processes or mp.cpu_count()
+    if verbose:
+        print(f"LNS start: {round(cost, 2)}, regions of {region_size} facilities, {processes} processes")
+
+    rounds = 0
+    with mp.Pool(processes) as pool:
+        while time.time() < deadline:
+            rounds += 1
+            round_time = max(min(sub_time, deadline - time.time()), 1)
+            regions = pick_regions(rng, solution, near_facilities, region_size, processes)
+            tasks = [build_task(distance_table, setup_costs, capacities, demands, solution, region, round_time, k,
+                                rng.randrange(2**31)) for region in regions]
+            for region, region_customers, sub_solution, gain in pool.imap_unordered(_solve_region, tasks):
+                if gain > 1e-6:
+                    for c, f in zip(region_customers.tolist(), sub_solution):
+                        solution[c] = int(region[f])
+                    cost -= gain
+                    history.append((round(time.time() - start_time, 2), cost))
+                    if verbose:
+                        print(f"LNS round {rounds}: {round(cost, 2)} ({history[-1][0]}s)")
+    return solution, get_cost(distance_table, setup_costs, solution), history
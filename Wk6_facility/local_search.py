@@ -0,0 +1,145 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Local search for capacitated facility location, run after the greedy construction.
+# Moves: reassign a customer to another facility, swap the facilities of two customers,
+# close a facility (its customers go to the nearest open facilities with room) and open a
+# facility (it takes the customers that are closer to it than to their current one).
+# Every move is priced from the per-facility load/count aggregates that FacilitySolution
+# (facility_solution.py) maintains, never by re-summing the whole solution, and a move is only
+# applied if all capacities hold.
+
+import time
+
+from facility_solution import FacilitySolution
+from spatial import nearest_customers, nearest_facilities
+
+EPS = 1e-7
+
+
+def try_reassign(state, c, near_facilities):
+    best_delta = -EPS
+    best_g = -1
+    for g in near_facilities[c]:
+        if g != state.solution[c] and state.fits(g, state.demand[c]):
+            delta = state.reassign_delta(c, g)
+            if delta < best_delta:
+                best_delta = delta
+                best_g = g
+    if best_g >= 0:
+        state.move(c, best_g)
+        return True
+    return False
+
+
+def try_swap(state, c1, near_facilities):
+    # swaps c1 with a customer of one of c1's nearby facilities; set-up costs are unchanged
+    dist = state.dist
+    f = state.solution[c1]
+    d1 = state.demand[c1]
+    for g in near_facilities[c1]:
+        if g == f or not state.is_open[g]:
+            continue
+        base = dist(g, c1) - dist(f, c1)
+        for c2 in state.members[g]:
+            d2 = state.demand[c2]
+            if not state.fits(f, d2 - d1) or not state.fits(g, d1 - d2):
+                continue
+            delta = base + dist(f, c2) - dist(g, c2)
+            if delta < -EPS:
+                state.move(c1, g)
+                state.move(c2, f)
+                return True
+    return False
+
+
+def try_close(state, f, near_facilities):
+    # closes f if its customers can be moved to other open facilities for less than its set-up cost
+    members = sorted(state.members[f], key=lambda c: -state.demand[c])
+    extra_load = {}
+    targets = []
+    delta = -state.setup[f]
+    for c in members:
+        best_g = -1
+        best_cost = float('inf')
+        for g in near_facilities[c]:
+            if g != f and state.is_open[g] and state.load[g] + extra_load.get(g, 0) + state.demand[c] <= state.cap[g]:
+                cost = state.dist(g, c)
+                if cost < best_cost:
+                    best_cost = cost
+                    best_g = g
+        if best_g < 0:
+            return False
+        extra_load[best_g] = extra_load.get(best_g, 0) + state.demand[c]
+        targets.append((c, best_g))
+        delta += best_cost - state.dist(f, c)
+    if delta < -EPS:
+        for c, g in targets:
+            state.move(c, g)
+        return True
+    return False
+
+
+def try_open(state, g, near_customers):
+    # opens g and hands it the nearby customers that gain the most, while g has room
+    # facilities emptied along the way give back their set-up cost
+    gains = []
+    for c in near_customers[g]:
+        f = state.solution[c]
+        gain = state.dist(f, c) - state.dist(g, c)
+        if gain > 0:
+            gains.append((gain, c))
+    gains.sort(reverse=True)
+    delta = state.setup[g]
+    room = state.cap[g]
+    left = {}
+    chosen = []
+    for gain, c in gains:
+        if state.demand[c] <= room:
+            room -= state.demand[c]
+            f = state.solution[c]
+            left[f] = left.get(f, state.count[f]) - 1
+            delta -= gain
+            if left[f] == 0:
+                delta -= state.setup[f]
+            chosen.append(c)
+    if chosen and delta < -EPS:
+        for c in chosen:
+            state.move(c, g)
+        return True
+    return False
+
+
+def local_search(distance_table, setup_costs, capacities, demands, solution, time_limit=None, k=10, open_scan=200, verbose=True, debug=False):
+    # returns (solution, cost); stops at a local optimum or when time_limit seconds have passed
+    # k nearest facilities are tried for each customer, an opened facility looks at its open_scan nearest customers
+    # debug checks the solution's aggregates after every move (slow)
+    start_time = time.time()
+    deadline = None if time_limit is None else start_time + time_limit
+    state = FacilitySolution(distance_table, setup_costs, capacities, demands, solution, debug)
+    facility_count, customer_count = distance_table.shape
+    near_facilities = nearest_facilities(distance_table, k).tolist()
+    near_customers = nearest_customers(distance_table, open_scan).tolist()
+    if verbose:
+        print(f"Local Search start: {round(state.cost, 2)}")
+
+    improved = True
+    passes = 0
+    while improved and (deadline is None or time.time() < deadline):
+        improved = False
+        passes += 1
+        for c in range(customer_count):
+            if try_reassign(state, c, near_facilities) or try_swap(state, c, near_facilities):
+                improved = True
+            if deadline is not None and c % 64 == 0 and time.time() > deadline:
+                break
+        for f in range(facility_count):
+            if deadline is not None and time.time() > deadline:
+                break
+            if state.is_open[f]:
+                improved |= try_close(state, f, near_facilities)
+            else:
+                improved |= try_open(state, f, near_customers)
+        if verbose:
+            print(f"Local Search pass {passes}: {round(state.cost, 2)} ({round(time.time() - start_time, 1)}s)")
+    return state.solution, state.cost
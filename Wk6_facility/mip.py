@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Optional MIP backend for capacitated facility location.
+# Model: y_f = 1 if f is open, x_fc = 1 if c is served by f (single sourcing)
+#   min  sum setup_f y_f + sum dist_fc x_fc
+#   s.t. sum_f x_fc = 1                    for every c
+#        sum_c demand_c x_fc <= cap_f y_f  for every f
+#        x_fc <= y_f                       for every pair (only while the model is small)
+# x_fc only exists for each customer's k nearest facilities (plus the facility of the warm start),
+# which keeps the 2000x2000 model at 2000*k columns instead of 4M.
+# Uses highspy (HiGHS) when installed, which also takes the warm start; otherwise falls back to
+# scipy.optimize.milp (also HiGHS, but without a warm start). With neither, solve_mip returns None.
+
+import time
+
+import numpy as np
+
+from spatial import nearest_facilities
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+try:
+    from scipy.optimize import Bounds, LinearConstraint, milp
+    from scipy.sparse import csc_matrix
+except ImportError:
+    milp = None
+
+LINK_LIMIT = 50000 # skip the x_fc <= y_f rows above this many pairs
+
+
+def mip_available():
+    return highspy is not None or milp is not None
+
+
+def build_model(distance_table, setup_costs, capacities, demands, solution, k):
+    # returns the model as sparse column-wise arrays plus the (f, c) pair of every x column
+    facility_count, customer_count = distance_table.shape
+    near = nearest_facilities(distance_table, k).T
+    k = near.shape[0]
+    pair_f = near.T.ravel()
+    pair_c = np.repeat(np.arange(customer_count), k)
+    warm_f = np.asarray(solution)
+    missing = ~(near == warm_f[None, :]).any(axis=0)
+    pair_f = np.concatenate([pair_f, warm_f[missing]])
+    pair_c = np.concatenate([pair_c, np.flatnonzero(missing)])
+    pair_count = len(pair_f)
+    demands = np.asarray(demands, dtype=np.float64)
+    capacities = np.asarray(capacities, dtype=np.float64)
+    link = pair_count <= LINK_LIMIT
+
+    col_cost = np.concatenate([np.asarray(setup_costs, dtype=np.float64), distance_table[pair_f, pair_c]])
+    x_cols = facility_count + np.arange(pair_count)
+    cap_row0 = customer_count
+    link_row0 = customer_count + facility_count
+    rows = [pair_c, cap_row0 + pair_f, cap_row0 + np.arange(facility_count)]
+    cols = [x_cols, x_cols, np.arange(facility_count)]
+    vals = [np.ones(pair_count), demands[pair_c], -capacities]
+    row_count = customer_count + facility_count
+    if link:
+        rows += [link_row0 + np.arange(pair_count), link_row0 + np.arange(pair_count)]
+        cols += [x_cols, pair_f]
+        vals += [np.ones(pair_count), -np.ones(pair_count)]
+        row_count += pair_count
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    vals = np.concatenate(vals)
+    order = np.lexsort((rows, cols))
+    col_count = facility_count + pair_count
+    start = np.concatenate([[0], np.cumsum(np.bincount(cols, minlength=col_count))])
+
+    row_lower = np.full(row_count, -np.inf)
+    row_upper = np.zeros(row_count)
+    row_lower[:customer_count] = 1
+    row_upper[:customer_count] = 1
+
+    warm = np.zeros(col_count)
+    warm[np.unique(warm_f)] = 1
+    warm[facility_count + np.flatnonzero(pair_f == warm_f[pair_c])] = 1
+    model = {'cost': col_cost, 'start': start, 'index': rows[order], 'value': vals[order],
+             'row_lower': row_lower, 'row_upper': row_upper, 'shape': (row_count, col_count)}
+    return model, pair_f, pair_c, warm
+
+
+def run_highspy(model, warm, time_limit, verbose):
+    row_count, col_count = model['shape']
+    h = highspy.Highs()
+    h.setOptionValue('output_flag', verbose)
+    h.setOptionValue('time_limit', float(time_limit))
+    lp = highspy.HighsLp()
+    lp.num_col_ = col_count
+    lp.num_row_ = row_count
+    lp.col_cost_ = model['cost']
+    lp.col_lower_ = np.zeros(col_count)
+    lp.col_upper_ = np.ones(col_count)
+    lp.row_lower_ = model['row_lower']
+    lp.row_upper_ = model['row_upper']
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_ = model['start']
+    lp.a_matrix_.index_ = model['index']
+    lp.a_matrix_.value_ = model['value']
+    lp.integrality_ = [highspy.HighsVarType.kInteger]*col_count
+    h.passModel(lp)
+    start = highspy.HighsSolution()
+    start.col_value = warm.tolist()
+    h.setSolution(start)
+    h.run()
+    info = h.getInfo()
+    if info.primal_solution_status != 2: # 2 = feasible
+        return None, None
+    return np.array(h.getSolution().col_value), info.mip_dual_bound
+
+
+def run_scipy(model, time_limit, verbose):
+    row_count, col_count = model['shape']
+    matrix = csc_matrix((model['value'], model['index'], model['start']), shape=model['shape'])
+    result = milp(model['cost'], constraints=LinearConstraint(matrix, model['row_lower'], model['row_upper']),
+                  integrality=np.ones(col_count), bounds=Bounds(0, 1),
+                  options={'time_limit': time_limit, 'disp': verbose})
+    if result.x is None:
+        return None, None
+    return result.x, getattr(result, 'mip_dual_bound', None)
+
+
+def solve_mip(distance_table, setup_costs, capacities, demands, solution, time_limit=60, k=10, verbose=True):
+    # returns (solution, cost, lower bound) or None if no solver is installed or nothing feasible was found
+    # the lower bound only holds for the restricted model (k nearest facilities per customer)
+    if not mip_available():
+        if verbose:
+            print("No MIP solver installed (highspy or scipy), skipping MIP")
+        return None
+    start_time = time.time()
+    model, pair_f, pair_c, warm = build_model(distance_table, setup_costs, capacities, demands, solution, k)
+    if verbose:
+        print(f"MIP: {model['shape'][1]} columns, {model['shape'][0]} rows, {'highspy' if highspy is not None else 'scipy'}")
+    if highspy is not None:
+        values, bound = run_highspy(model, warm, time_limit, verbose=False)
+    else:
+        values, bound = run_scipy(model, time_limit, verbose=False)
+    if values is None:
+        return None
+
+    new_solution = list(solution)
+    for p in np.flatnonzero(values[len(setup_costs):] > 0.5):
+        new_solution[pair_c[p]] = int(pair_f[p])
+    cost = float(model['cost'] @ np.round(values))
+    if verbose:
+        print(f"MIP: {round(cost, 2)}, bound {bound} ({round(time.time() - start_time, 1)}s)")
+    return new_solution, cost, bound
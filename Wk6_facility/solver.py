@@ -1,103 +1,86 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-from collections import namedtuple
-import math
+import heapq
+import time
 import numpy as np
-
-Point = namedtuple("Point", ['x', 'y'])
-Facility = namedtuple("Facility", ['index', 'setup_cost', 'capacity', 'location'])
-Customer = namedtuple("Customer", ['index', 'demand', 'location'])
-
-def length(point1, point2):
-    return math.sqrt((point1.x - point2.x)**2 + (point1.y - point2.y)**2)
-
-def build_distance_table(facilities, customers):
+from facility_solution import FacilitySolution
+from instance import FacilityInstance
+from local_search import local_search
+from mip import solve_mip
+from lns import large_neighborhood_search
+from lagrangian import lagrangian_relaxation
+
+def build_distance_table(instance, dtype=np.float64, chunk_size=None):
     # distance from f's to c's; only called once
-    distance_table = np.zeros((len(facilities), len(customers)))
-    for facility in facilities:
-        for customer in customers:
-            distance_table[facility.index, customer.index] = length(facility.location, customer.location)
+    # one broadcast expression over the coordinate arrays; float32 halves the memory of the big tables
+    # chunk_size limits how many facility rows are built at a time so the temporaries stay small
+    facility_count = instance.facility_count
+    chunk_size = max(chunk_size or facility_count, 1)
+    distance_table = np.empty((facility_count, instance.customer_count), dtype=dtype)
+    for start in range(0, facility_count, chunk_size):
+        dx = instance.facility_x[start:start+chunk_size, None] - instance.customer_x[None, :]
+        dy = instance.facility_y[start:start+chunk_size, None] - instance.customer_y[None, :]
+        distance_table[start:start+chunk_size] = np.sqrt(dx*dx + dy*dy)
     return distance_table
 
-def find_avg_point(customers):
+def find_avg_point(instance):
     # only called once
-    x_avg = y_avg = 0
-    for customer in customers:
-        x_avg += customer.location.x/len(customers)
-        y_avg += customer.location.y/len(customers)
-    return Point(round(x_avg,2), round(y_avg,2))
+    return round(float(instance.customer_x.mean()), 2), round(float(instance.customer_y.mean()), 2)
 
-def get_obj_value(distance_table, facilities, customers, solution, f_assigned):
+def get_cost_of_setup(distance_table, instance, f, c_set):
     # gets the cost of a single f and any indicated c's
-    obj = 0
-    for f in facilities:
-        obj += f_assigned[f.index] * facilities[f.index].setup_cost
-    for index, assigned_c in enumerate(solution):
-        obj += distance_table[assigned_c, index]
-    return obj
-
-def get_cost_of_setup(facility, c_set):
-    # gets the cost of a single f and any indicated c's
-    cost = facility.setup_cost
-    for customer in c_set:
-        cost += length(customer.location, facility.location)
-    return cost
+    return float(instance.setup_cost[f] + distance_table[f, c_set].sum())
+
 
+def build_customer_order(distance_table):
+    # for every f, its customers sorted by distance (argsort index array); only called once
+    return np.argsort(distance_table, axis=1, kind='stable').astype(np.int32)
 
-def get_low_cost_set(distance_table, facility, customers, solution):
+def get_low_cost_set(customer_order, f, capacity, demands, solution, min_demand):
     # finds closest available c's to a f until capacity is reached
     # may try an inverse; for each c in order of demand, assign it to the nearest f.
+    # customer_order[f] is presorted by distance, so this is a forward scan that skips assigned c's
+    # demands is the instance's demand array as a list, which is cheaper to index in this loop
     
-    cap = facility.capacity
-    # c_copy = list(customers)
-    c_distances = distance_table[facility.index].tolist()
-    c_demands = [c.demand for c in customers]
+    cap = capacity
     low_cost_set = []
-    # find the lowest-distance customer and pop it
-    # if it is unassigned and cap > demand: add it to open_set and update cap
-    while len(c_distances) > 0:
-        c_close_index = c_distances.index(min(c_distances)) # c_distances
-        c_distances.pop(c_close_index)
-        c_closest = customers.pop(c_close_index)
-        if solution.pop(c_close_index) == -1 and c_closest.demand <= cap:
-            low_cost_set.append(c_closest)
-            cap -= c_closest.demand
-        if cap < min(c_demands): # speedup
-            break
+    for c_index in customer_order[f].tolist():
+        # if it is unassigned and cap > demand: add it to open_set and update cap
+        if solution[c_index] == -1 and demands[c_index] <= cap:
+            low_cost_set.append(c_index)
+            cap -= demands[c_index]
+            if cap < min_demand: # speedup
+                break
     return low_cost_set
 
-def find_unassigned_point(customers, solution, avg_point):
-    # try to ensure compactness of the solution by prioritizing points that are near the average of all assigned points
-    # we could also try finding the free-point closest to just the most recently assigned facility
-    # we could also try finding the free-point farthest from the average of all points
-    # not modifying original lists here
-    dist = float("inf")
-    for customer in customers:
-        if solution[customer.index] == -1 and length(customer.location, avg_point) < dist:
-            dist = length(customer.location, avg_point)
-            c_unassigned = customer
-    return c_unassigned
-
-def solve_it(input_data):
+def update_low_cost_set(distance_table, customer_order, instance, f, demands, solution, min_demand, f_lcs, f_cpc, c_in_lcs, cpc_heap):
+    # recomputes the low cost set and cpc of one f, and keeps the c -> f's index and the cpc heap in sync
+    for c in f_lcs[f]:
+        c_in_lcs[c].discard(f)
+    low_cost_set = get_low_cost_set(customer_order, f, int(instance.capacity[f]), demands, solution, min_demand)
+    f_cpc[f] = get_cost_of_setup(distance_table, instance, f, low_cost_set)/max(len(low_cost_set),1)
+    f_lcs[f] = low_cost_set
+    for c in low_cost_set:
+        c_in_lcs[c].add(f)
+    heapq.heappush(cpc_heap, (f_cpc[f], f))
+
+def solve_it(input_data, time_limit=None, use_mip=None, mip_k=10, use_lns=None, processes=None, use_lagrangian=None):
     # Modify this code to run your optimization algorithm
-
-    # parse the input
-    lines = input_data.split('\n')
-
-    parts = lines[0].split()
-    facility_count = int(parts[0])
-    customer_count = int(parts[1])
-    
-    facilities = []
-    for i in range(1, facility_count+1):
-        parts = lines[i].split()
-        facilities.append(Facility(i-1, float(parts[0]), int(parts[1]), Point(float(parts[2]), float(parts[3])) ))
-
-    customers = []
-    for i in range(facility_count+1, facility_count+1+customer_count):
-        parts = lines[i].split()
-        customers.append(Customer(i-1-facility_count, int(parts[0]), Point(float(parts[1]), float(parts[2]))))
+    # time_limit: wall-clock seconds for the whole run; the local search gets whatever the greedy leaves
+    # (without a limit it runs to a local optimum)
+    # use_mip: hand the warm-started model to a MIP solver (see mip.py); defaults to on for the small instances
+    # mip_k: each customer may only go to one of its mip_k nearest facilities in the MIP
+    # use_lns: spend the time left on large neighbourhood search (lns.py) over `processes` worker processes;
+    # defaults to on when there is a time_limit and the instance is too big for the full MIP
+    # use_lagrangian: run the Lagrangian relaxation (lagrangian.py) for a lower bound and a repaired solution;
+    # defaults to on when there is a time_limit
+    start_time = time.time()
+
+    # parse the input into one array per attribute (see instance.py)
+    instance = FacilityInstance.parse(input_data)
+    facility_count = instance.facility_count
+    customer_count = instance.customer_count
 
 # Number of f's, c's (filename) and the first-pass values (threshold values):
 # 25, 50:               3.82M (4M, 3.26M)
@@ -114,53 +97,95 @@ def solve_it(input_data):
 
     
 
-    solution = [-1]*len(customers)
-    capacity_remaining = [f.capacity for f in facilities]
-    avg_point = find_avg_point(customers)
+    avg_point = find_avg_point(instance)
 
-    print(f"Facilities: {len(facilities)}, Customers: {len(customers)}")
+    print(f"Facilities: {facility_count}, Customers: {customer_count}")
     print(f"Average Point: {avg_point}")
     print("Building Distance Table...")
 
-    distance_table = build_distance_table(facilities,customers)
-    f_cpc = [f.setup_cost for f in facilities]
-    f_lcs = [0]*len(facilities)
-    f_assigned = [0]*len(facilities)
-    obj = 0
+    distance_table = build_distance_table(instance, chunk_size=256)
+    customer_order = build_customer_order(distance_table)
+    demands = instance.demand.tolist()
+    min_demand = min(demands)
+    f_cpc = instance.setup_cost.tolist()
+    f_lcs = [[] for f in range(facility_count)]
+    state = FacilitySolution(distance_table, instance.setup_cost, instance.capacity, instance.demand) # running greedy cost
+    solution = state.solution
+    c_in_lcs = [set() for c in range(customer_count)] # inverted index: c -> f's whose low cost set contains it
+    cpc_heap = [] # (cpc, f); entries go stale when an f is assigned or its cpc is recomputed
 
     print("Finding Efficient Locations...")
     print("Facility, Cap Used, Cap Left, Setup Cost, Total Cost, CPC, Low Cost Set")
 
-    while(min(solution) == -1):
-        for facility in facilities:
-            if not any(f_assigned) or (not f_assigned[facility.index] and max([solution[c.index] for c in f_lcs[facility.index]]) > -1):
-                # condition should only evaluate f's whose sets were affected by the previous assignment
-                low_cost_set = get_low_cost_set(distance_table, facility, list(customers), list(solution))
-                cost_of_setup = get_cost_of_setup(facility, low_cost_set) - 0 * facility.setup_cost
-                f_cpc[facility.index] = cost_of_setup/max(len(low_cost_set),1)
-                f_lcs[facility.index] = low_cost_set
-            # we can try either assigning the lowest-cost f, or assigning the f with the lowest cost-per-customer
-        f_lowest_cpc_found = float("inf")
-        f_low = f_assigned.index(0) # there will always be at least one f unassigned
-        c_unassigned = find_unassigned_point(customers, solution, avg_point)
-        for facility in facilities:
-            if not f_assigned[facility.index] and f_cpc[facility.index] < f_lowest_cpc_found:
-                f_low = facility.index
-                f_lowest_cpc_found = f_cpc[facility.index]
-
-        cap_used = sum([c.demand for c in f_lcs[f_low]])
-        cap = facilities[f_low].capacity
-        print(f_low, cap_used, cap-cap_used, facilities[f_low].setup_cost, round(f_cpc[f_low]*len(f_lcs[f_low]),2), round(f_cpc[f_low],2), [f.index for f in f_lcs[f_low]])
-
-        obj += get_cost_of_setup(facilities[f_low], f_lcs[f_low])
+    for f in range(facility_count):
+        update_low_cost_set(distance_table, customer_order, instance, f, demands, solution, min_demand, f_lcs, f_cpc, c_in_lcs, cpc_heap)
+    unassigned_count = customer_count
+
+    while unassigned_count > 0:
+        # we can try either assigning the lowest-cost f, or assigning the f with the lowest cost-per-customer
+        while True:
+            cpc, f_low = heapq.heappop(cpc_heap)
+            if not state.is_open[f_low] and cpc == f_cpc[f_low]:
+                break
+        cap_used = sum([demands[c] for c in f_lcs[f_low]])
+        cap = int(instance.capacity[f_low])
+        print(f_low, cap_used, cap-cap_used, instance.setup_cost[f_low], round(f_cpc[f_low]*len(f_lcs[f_low]),2), round(f_cpc[f_low],2), f_lcs[f_low])
+
+        affected = set()
         for c in f_lcs[f_low]:
-            solution[c.index] = f_low
-        f_assigned[f_low] = 1
-
-    obj2 = get_obj_value(distance_table, facilities, customers, solution, f_assigned)
-    print(f"Total Facilities Assigned: {sum(f_assigned)} of {len(facilities)}")
-    print(f"Average Cost per Facility: {round(obj/sum(f_assigned),2)}")
-    print(f"Average Cost per Customer: {round(obj/len(customers),2)}")
+            state.assign(c, f_low)
+            affected |= c_in_lcs[c]
+        unassigned_count -= len(f_lcs[f_low])
+
+        # only f's whose sets were affected by this assignment need a new low cost set
+        for f in sorted(affected):
+            if not state.is_open[f]:
+                update_low_cost_set(distance_table, customer_order, instance, f, demands, solution, min_demand, f_lcs, f_cpc, c_in_lcs, cpc_heap)
+
+    print(f"Greedy Obj. Value: {round(state.cost, 2)}")
+    time_left = None
+    if time_limit is not None:
+        time_left = max(time_limit - (time.time() - start_time), 0)
+    solution, cost = local_search(distance_table, instance.setup_cost, instance.capacity,
+                               instance.demand, solution, time_left)
+
+    lower_bound = None
+    if use_lagrangian is None:
+        use_lagrangian = time_limit is not None
+    if use_lagrangian:
+        lagrangian_time = 30
+        if time_limit is not None:
+            lagrangian_time = min(0.2*max(time_limit - (time.time() - start_time), 0), 30)
+        solution, cost, lower_bound = lagrangian_relaxation(distance_table, instance.setup_cost, instance.capacity,
+                                                         instance.demand, solution, lagrangian_time)
+
+    if use_mip is None:
+        use_mip = facility_count*customer_count <= 20000 # 25x50, 50x200, 100x100
+    if use_mip:
+        mip_time = 60
+        if time_limit is not None:
+            mip_time = max(time_limit - (time.time() - start_time), 1)
+        result = solve_mip(distance_table, instance.setup_cost, instance.capacity,
+                           instance.demand, solution, mip_time, mip_k)
+        # without a warm start (scipy) a time-limited MIP can stop at a worse incumbent
+        if result is not None and result[1] < cost - 1e-6:
+            solution, cost = result[0], result[1]
+
+    if use_lns is None:
+        use_lns = not use_mip and time_limit is not None
+    if use_lns and time_limit is not None and time_limit - (time.time() - start_time) > 1:
+        solution, _, history = large_neighborhood_search(distance_table, instance.facility_xy,
+                                                         instance.setup_cost, instance.capacity,
+                                                         instance.demand, solution,
+                                                         time_limit - (time.time() - start_time), processes=processes)
+        print(f"LNS improvements: {len(history) - 1}")
+    state = FacilitySolution(distance_table, instance.setup_cost, instance.capacity, instance.demand, solution)
+    obj = state.cost
+    print(f"Total Facilities Assigned: {state.open_count()} of {facility_count}")
+    print(f"Average Cost per Facility: {round(obj/state.open_count(),2)}")
+    print(f"Average Cost per Customer: {round(obj/customer_count,2)}")
+    if lower_bound is not None:
+        print(f"Lower Bound: {round(lower_bound, 2)}, Gap: {round(100*(obj - lower_bound)/obj, 2)}%")
 
     # trivial solution
 #    facility_index = 0
@@ -198,7 +223,8 @@ if __name__ == '__main__':
         file_location = sys.argv[1].strip()
         with open(file_location, 'r') as input_data_file:
             input_data = input_data_file.read()
-        print(solve_it(input_data))
+        time_limit = float(sys.argv[2]) if len(sys.argv) > 2 else None
+        print(solve_it(input_data, time_limit))
     else:
-        print('This test requires an input file.  Please select one from the data directory. (i.e. python solver.py ./data/fl_16_2)')
+        print('This test requires an input file.  Please select one from the data directory. (i.e. python solver.py ./data/fl_16_2 [seconds])')
 
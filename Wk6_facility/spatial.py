@@ -0,0 +1,39 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Spatial indexes for the facility code.
+# The knn helpers give each customer its nearest facilities, each facility its nearest customers and
+# each facility its nearest facilities, partially sorted with argpartition instead of full argsorts.
+
+import numpy as np
+
+
+def nearest_facilities(distance_table, k):
+    # (customers, k) array: each customer's k nearest facilities, nearest first
+    k = min(k, distance_table.shape[0])
+    return smallest_k(distance_table.T, k)
+
+
+def nearest_customers(distance_table, k):
+    # (facilities, k) array: each facility's k nearest customers, nearest first
+    k = min(k, distance_table.shape[1])
+    return smallest_k(distance_table, k)
+
+
+def facility_neighbors(facility_xy, k):
+    # (facilities, k) array: each facility's k nearest facilities, itself first
+    facility_xy = np.asarray(facility_xy, dtype=np.float64)
+    diff = facility_xy[:, None, :] - facility_xy[None, :, :]
+    sq_dist = np.einsum('ijk,ijk->ij', diff, diff)
+    np.fill_diagonal(sq_dist, -1)
+    return smallest_k(sq_dist, min(k, len(facility_xy)))
+
+
+def smallest_k(rows, k):
+    # column indices of the k smallest values of every row, in increasing order
+    if k < rows.shape[1]:
+        part = np.argpartition(rows, k-1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(rows.shape[1]), (rows.shape[0], 1))
+    order = np.argsort(np.take_along_axis(rows, part, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1).astype(np.int32)
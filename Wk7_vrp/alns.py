@@ -0,0 +1,198 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Adaptive large neighbourhood search for the VRP (after Ropke and Pisinger).
+# Every iteration removes some customers with a destroy operator and puts them back with a repair
+# operator; the result replaces the current solution under simulated annealing acceptance.
+# Destroy: random, worst (largest detour first), Shaw (customers related to a random seed by distance
+# and demand) and route (one whole route). Repair: cheapest and regret-2/3 insertion on the cached
+# insertion costs of insertion.py.
+# Operators are picked by roulette wheel; every segment of SEGMENT iterations the weights move towards
+# the scores the operators earned (new best, better than current, accepted).
+# The temperature falls geometrically with the time used (or the iterations, with max_iterations), so
+# with a fixed max_iterations and no time limit a run is fully determined by its seed.
+# A long search can be run as several calls (the epochs of islands.py): the caller passes the same
+# weights dict and start temperature to every call, and each call covers its own slice of the cooling
+# schedule (progress_offset, progress_scale), so annealing and weight adaptation span the whole search.
+# New best solutions are polished with the VND of neighborhoods.py and logged as (seconds, iteration, cost).
+# With a route pool (route_pool.py) the routes of every accepted solution go into the pool, and every
+# recombine_every iterations a set-partitioning solve over the pool tries to combine them into a better
+# best solution, which then also becomes the current one.
+
+import math
+import random
+import time
+
+import numpy as np
+
+from insertion import InsertionCache, regret_insertion
+from neighborhoods import vnd
+from route_pool import recombine
+from routes import RouteSet
+
+SEGMENT = 100
+RECOMBINE_TIME = 5 # seconds per set-partitioning solve in timed runs, at most a tenth of the time limit
+REACTION = 0.2
+SCORES = (33, 9, 13) # new best, better than current, accepted worse
+START_WORSE = 0.05 # a solution this much worse is accepted with probability 1/2 at the start
+END_TEMPERATURE = 0.002 # final temperature as a fraction of the starting one
+
+
+def pick_randomized(rng, ranked, count, power):
+    # takes count items from a ranked list, biased towards the front (higher power = more greedy)
+    ranked = list(ranked)
+    chosen = []
+    while ranked and len(chosen) < count:
+        chosen.append(ranked.pop(int(len(ranked)*rng.random()**power)))
+    return chosen
+
+
+def random_removal(rs, rng, count, distances):
+    customers = [c for c in range(len(rs.route_of)) if rs.route_of[c] >= 0]
+    return rng.sample(customers, min(count, len(customers)))
+
+
+def worst_removal(rs, rng, count, distances):
+    dist = rs.dist
+    detour = []
+    for c in range(len(rs.route_of)):
+        if rs.route_of[c] >= 0:
+            p, n = rs.pred(c), rs.succ(c)
+            detour.append((dist(p, c) + dist(c, n) - dist(p, n), c))
+    detour.sort(reverse=True)
+    return pick_randomized(rng, [c for _, c in detour], count, 3)
+
+
+def shaw_removal(rs, rng, count, distances):
+    customers = np.array([c for c in range(len(rs.route_of)) if rs.route_of[c] >= 0])
+    seed = int(customers[rng.randrange(len(customers))])
+    demand = np.asarray(rs.demand, dtype=np.float64)
+    row = np.asarray(distances.row(seed), dtype=np.float64)[customers]
+    relatedness = row/max(row.max(), 1e-9) + np.abs(demand[customers] - demand[seed])/max(demand.max(), 1e-9)
+    return pick_randomized(rng, customers[np.argsort(relatedness, kind='stable')].tolist(), count, 6)
+
+
+def route_removal(rs, rng, count, distances):
+    used = [r for r in range(len(rs.routes)) if rs.routes[r]]
+    return list(rs.routes[rng.choice(used)])
+
+
+DESTROY = [('random', random_removal), ('worst', worst_removal), ('shaw', shaw_removal), ('route', route_removal)]
+REPAIR = [('greedy', 1), ('regret-2', 2), ('regret-3', 3)]
+
+
+def initial_weights():
+    return {'destroy': [1.0]*len(DESTROY), 'repair': [1.0]*len(REPAIR)}
+
+
+def initial_temperature(cost):
+    return -START_WORSE*cost/math.log(0.5)
+
+
+def alns(rs, distances, neighbors, time_limit=None, max_iterations=None, seed=0, removal=(0.05, 0.25),
+         max_removal=60, verbose=True, log_every=500, pool=None, recombine_every=500, weights=None,
+         start_temperature=None, progress_offset=0.0, progress_scale=1.0):
+    # improves the feasible RouteSet rs; returns (best routes, best length, history)
+    # removal: fraction of the customers removed per iteration is drawn from this range (at most max_removal)
+    # pool: a RoutePool collecting the accepted routes, recombined every recombine_every iterations
+    # weights: operator weights (initial_weights()) to start from; updated in place
+    # start_temperature: defaults to initial_temperature of rs's length
+    # progress_offset, progress_scale: this call covers that slice of the cooling schedule
+    if time_limit is None and max_iterations is None:
+        raise ValueError("alns needs a time_limit or max_iterations")
+    start_time = time.time()
+    rng = random.Random(seed)
+    demands, capacity, depot = rs.demand, rs.capacity, rs.depot
+    customer_count = sum(1 for c in rs.route_of if c >= 0)
+    low = max(1, int(removal[0]*customer_count))
+    high = max(low, min(int(removal[1]*customer_count), max_removal))
+
+    current = [list(route) for route in rs.routes]
+    current_cost = rs.total_length()
+    best, best_cost = current, current_cost
+    history = [(0.0, 0, best_cost)]
+    if start_temperature is None:
+        start_temperature = initial_temperature(current_cost)
+    temperature = start_temperature*END_TEMPERATURE**progress_offset
+
+    if weights is None:
+        weights = initial_weights()
+    scores = {'destroy': [0.0]*len(DESTROY), 'repair': [0.0]*len(REPAIR)}
+    uses = {'destroy': [0]*len(DESTROY), 'repair': [0]*len(REPAIR)}
+
+    iteration = 0
+    while True:
+        elapsed = time.time() - start_time
+        progress = 0
+        if time_limit is not None:
+            progress = elapsed/time_limit
+        if max_iterations is not None:
+            progress = max(progress, iteration/max_iterations)
+        if progress >= 1:
+            break
+        iteration += 1
+        temperature = start_temperature*END_TEMPERATURE**(progress_offset + progress_scale*progress)
+
+        d = rng.choices(range(len(DESTROY)), weights['destroy'])[0]
+        r = rng.choices(range(len(REPAIR)), weights['repair'])[0]
+        uses['destroy'][d] += 1
+        uses['repair'][r] += 1
+
+        candidate = RouteSet(current, distances, demands, capacity, depot)
+        cache = InsertionCache(candidate, distances)
+        cache.remove(DESTROY[d][1](candidate, rng, rng.randint(low, high), distances))
+        if regret_insertion(cache, REPAIR[r][1]):
+            cost = candidate.total_length()
+            score = 0
+            if cost < best_cost - 1e-9:
+                vnd(candidate, neighbors, verbose=False)
+                cost = candidate.total_length()
+                best, best_cost = [list(route) for route in candidate.routes], cost
+                history.append((round(time.time() - start_time, 2), iteration, best_cost))
+                score = SCORES[0]
+            elif cost < current_cost - 1e-9:
+                score = SCORES[1]
+            elif rng.random() < math.exp(-(cost - current_cost)/max(temperature, 1e-12)):
+                score = SCORES[2]
+            if score:
+                current, current_cost = [list(route) for route in candidate.routes], cost
+                scores['destroy'][d] += score
+                scores['repair'][r] += score
+                if pool is not None:
+                    pool.add_solution(candidate)
+
+        if pool is not None and iteration % recombine_every == 0:
+            # without a time limit the solve is not cut off either, so that a max_iterations run
+            # stays fully determined by its seed
+            recombine_time = None
+            if time_limit is not None:
+                recombine_time = min(RECOMBINE_TIME, 0.1*time_limit, start_time + time_limit - time.time())
+            combined = None
+            if recombine_time is None or recombine_time > 0.1:
+                combined = recombine(pool, RouteSet(best, distances, demands, capacity, depot), distances,
+                                     neighbors, recombine_time, verbose=False)
+            if combined is not None and combined.total_length() < best_cost - 1e-9:
+                vnd(combined, neighbors, verbose=False)
+                best, best_cost = [list(route) for route in combined.routes], combined.total_length()
+                current, current_cost = best, best_cost
+                history.append((round(time.time() - start_time, 2), iteration, best_cost))
+                if verbose:
+                    print(f"ALNS iteration {iteration}: route pool ({len(pool)} routes) gives {round(best_cost, 2)}")
+
+        if iteration % SEGMENT == 0:
+            for kind in weights:
+                for i in range(len(weights[kind])):
+                    if uses[kind][i]:
+                        weights[kind][i] = (1 - REACTION)*weights[kind][i] + REACTION*scores[kind][i]/uses[kind][i]
+                        weights[kind][i] = max(weights[kind][i], 0.05)
+                    scores[kind][i] = 0.0
+                    uses[kind][i] = 0
+        if verbose and iteration % log_every == 0:
+            print(f"ALNS iteration {iteration}: best {round(best_cost, 2)}, current {round(current_cost, 2)}, "
+                  f"T {round(temperature, 3)} ({round(time.time() - start_time, 1)}s)")
+
+    if verbose:
+        print(f"ALNS: {iteration} iterations, best {round(best_cost, 2)} ({round(time.time() - start_time, 1)}s)")
+        print("ALNS destroy weights: " + ', '.join(f"{name} {round(w, 2)}" for (name, _), w in zip(DESTROY, weights['destroy'])))
+        print("ALNS repair weights: " + ', '.join(f"{name} {round(w, 2)}" for (name, _), w in zip(REPAIR, weights['repair'])))
+    return best, best_cost, history
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Cheapest and regret-k insertion for the VRP, on top of a cache of insertion costs.
+# cost[r, c] / pos[r, c] hold the cheapest way to insert customer c into route r (extra length and
+# position). They are computed for a whole route at once with numpy: for the edges (a, b) of the
+# route, d(a, c) + d(c, b) - d(a, b) is one (edges, customers) array, and its column minimum is the
+# cache row. Inserting into a route only changes that route, so only its row is recomputed.
+# Capacity is not part of the cache; it is applied when the costs are read, from the route loads.
+
+import numpy as np
+
+UNREACHABLE = 1e12 # stands in for "no route has room" in the regret sums
+
+
+class InsertionCache:
+    def __init__(self, rs, distances):
+        self.rs = rs
+        self.distances = distances
+        n = len(rs.demand)
+        self.demand = np.asarray(rs.demand, dtype=np.float64)
+        self.cost = np.full((len(rs.routes), n), np.inf)
+        self.pos = np.zeros((len(rs.routes), n), dtype=np.int32)
+        self.length = np.zeros(len(rs.routes)) # current length of every route
+        self.unrouted = np.array([rs.route_of[c] < 0 and c != rs.depot for c in range(n)])
+        for r in range(len(rs.routes)):
+            self.update_route(r)
+
+    def update_route(self, r):
+        depot = self.rs.depot
+        seq = [depot] + self.rs.routes[r] + [depot]
+        rows = np.stack([self.distances.row(a) for a in seq]).astype(np.float64)
+        edge = rows[np.arange(len(seq)-1), seq[1:]]
+        extra = rows[:-1] + rows[1:] - edge[:, None]
+        self.length[r] = edge.sum()
+        best = extra.argmin(axis=0)
+        self.pos[r] = best
+        self.cost[r] = extra[best, np.arange(extra.shape[1])]
+
+    def feasible_costs(self):
+        # (routes, customers) insertion costs, inf where c is routed or the route has no room for it
+        room = self.rs.capacity - np.asarray(self.rs.load, dtype=np.float64)
+        ok = (self.demand[None, :] <= room[:, None]) & self.unrouted[None, :]
+        return np.where(ok, self.cost, np.inf)
+
+    def insert(self, c, r):
+        self.rs.insert(c, r, int(self.pos[r, c]))
+        self.unrouted[c] = False
+        self.update_route(r)
+
+    def remove(self, customers):
+        # takes customers out of their routes and refreshes the routes they left
+        changed = set()
+        for c in customers:
+            changed.add(self.rs.route_of[c])
+            self.rs.remove(c)
+            self.unrouted[c] = True
+        for r in changed:
+            self.update_route(r)
+
+
+def regret_insertion(cache, k=2):
+    # inserts every unrouted customer; k=1 is cheapest insertion (cheapest customer first), k>=2 picks the
+    # customer with the largest regret (how much worse its 2nd..kth best routes are than its best)
+    # returns False if some customer fits in no route, leaving it and the rest unrouted
+    route_count = len(cache.rs.routes)
+    while cache.unrouted.any():
+        candidates = np.flatnonzero(cache.unrouted)
+        costs = cache.feasible_costs()[:, candidates]
+        best = costs.min(axis=0)
+        if not np.isfinite(best).all():
+            return False
+        if k <= 1 or route_count == 1:
+            pick = int(np.argmin(best))
+        else:
+            kk = min(k, route_count)
+            nearest = np.minimum(np.partition(costs, kk-1, axis=0)[:kk], UNREACHABLE)
+            regret = (nearest - best[None, :]).sum(axis=0)
+            pick = int(np.lexsort((best, -regret))[0])
+        c = int(candidates[pick])
+        cache.insert(c, int(np.argmin(costs[:, pick])))
+    return True
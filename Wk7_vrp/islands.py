@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Island model: several ALNS runs (alns.py) on separate processes, each with its own seed.
+# The run is split into epochs of migration_interval seconds. After every epoch each island sends its
+# best solution to the parent over a pipe, and the parent sends every island the best solution of its
+# neighbour on a ring (island i gets island i-1's); an island adopts the migrant when it is better
+# than its own best. Ring migration spreads good solutions without making all islands identical.
+# VRP instances are small, so the coordinates and routes are simply pickled through the pipes.
+# Each island keeps its own route pool (route_pool.py), operator weights and cooling schedule over all
+# its epochs, so every epoch continues the island's ALNS run instead of starting it again.
+
+import multiprocessing as mp
+import time
+
+from alns import alns, initial_temperature, initial_weights
+from distances import DistanceProvider
+from knn import load_knn
+from route_pool import RoutePool
+from routes import RouteSet
+
+
+def _island(conn, coords, demands, capacity, depot, routes, seed, k, epoch_count, epoch_time):
+    distances = DistanceProvider(coords)
+    neighbors = load_knn(distances.coords, k).tolist()
+    best = RouteSet(routes, distances, demands, capacity, depot)
+    best_cost = best.total_length()
+    pool = RoutePool(capacity)
+    weights = initial_weights()
+    start_temperature = initial_temperature(best_cost)
+    for epoch in range(epoch_count):
+        routes, cost, _ = alns(best, distances, neighbors, epoch_time, seed=seed + 1000*epoch, verbose=False,
+                               pool=pool, weights=weights, start_temperature=start_temperature,
+                               progress_offset=epoch/epoch_count, progress_scale=1/epoch_count)
+        if cost < best_cost:
+            best, best_cost = RouteSet(routes, distances, demands, capacity, depot), cost
+        conn.send((best_cost, [list(route) for route in best.routes]))
+        migrant_cost, migrant = conn.recv()
+        if migrant_cost < best_cost - 1e-9:
+            best, best_cost = RouteSet(migrant, distances, demands, capacity, depot), migrant_cost
+    conn.close()
+
+
+def run_islands(coords, demands, capacity, routes, time_limit, processes=None, depot=0, seed=0, k=10,
+                migration_interval=5, verbose=True):
+    # returns (best routes, best length, history of the best length after every epoch)
+    start_time = time.time()
+    processes = processes or mp.cpu_count()
+    epoch_count = max(1, int(time_limit/migration_interval))
+    epoch_time = time_limit/epoch_count
+    coords = [tuple(map(float, c)) for c in coords]
+    links = []
+    workers = []
+    for island in range(processes):
+        parent_conn, child_conn = mp.Pipe()
+        worker = mp.Process(target=_island, args=(child_conn, coords, list(demands), capacity, depot, routes,
+                                                  seed + island, k, epoch_count, epoch_time), daemon=True)
+        worker.start()
+        child_conn.close()
+        links.append(parent_conn)
+        workers.append(worker)
+    if verbose:
+        print(f"Islands: {processes} processes, {epoch_count} epochs of {round(epoch_time, 1)}s")
+
+    best_cost = float('inf')
+    best_routes = routes
+    history = []
+    try:
+        for epoch in range(epoch_count):
+            results = [conn.recv() for conn in links]
+            for i, conn in enumerate(links):
+                conn.send(results[i-1]) # ring: island i gets island i-1's best
+            for cost, island_routes in results:
+                if cost < best_cost:
+                    best_cost, best_routes = cost, island_routes
+            history.append((round(time.time() - start_time, 2), best_cost))
+            if verbose:
+                print(f"Epoch {epoch+1}: best {round(best_cost, 2)}, islands " + ' '.join(str(round(cost, 1)) for cost, _ in results))
+    finally:
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+    return best_routes, best_cost, history
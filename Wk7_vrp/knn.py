@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# k-nearest-neighbour candidate lists for the routing solvers (the same file is in Wk4_tsp and Wk7_vrp).
+# knn[i] holds the k closest other points to point i, nearest first, as an (n, k) int32 array.
+# Built with scipy's k-d tree when scipy is installed, otherwise with a uniform grid; both are
+# O(n log n)-ish instead of the all-pairs scan. load_knn caches the result on disk, keyed by a hash
+# of the coordinates, so repeated runs on the same instance skip the build.
+
+import hashlib
+import math
+import os
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'knn_cache')
+
+
+def build_knn(coords, k):
+    # coords is an (n, 2) array
+    coords = np.asarray(coords, dtype=np.float64)
+    n = len(coords)
+    k = min(k, n-1)
+    if k <= 0:
+        return np.zeros((n, 0), dtype=np.int32)
+    if cKDTree is not None:
+        _, knn = cKDTree(coords).query(coords, k+1)
+        return drop_self(knn, k)
+    return build_knn_grid(coords, k)
+
+
+def drop_self(knn, k):
+    # removes each point from its own list; duplicates can put it anywhere in the first few slots
+    rows = np.arange(len(knn))[:, None]
+    keep = knn != rows
+    keep[keep.sum(axis=1) > k, -1] = False
+    return knn[keep].reshape(len(knn), k).astype(np.int32)
+
+
+def build_knn_grid(coords, k):
+    # uniform grid with about two points per cell; grows a ring of cells around each point
+    # until it holds k candidates, then adds one more ring so nothing closer is missed
+    n = len(coords)
+    xs = coords[:, 0].tolist()
+    ys = coords[:, 1].tolist()
+    min_x, min_y = min(xs), min(ys)
+    cells_per_side = max(1, int(math.sqrt(n/2)))
+    cell_w = max(max(xs) - min_x, max(ys) - min_y, 1e-9)/cells_per_side
+    grid = {}
+    for node in range(n):
+        key = (int((xs[node] - min_x)/cell_w), int((ys[node] - min_y)/cell_w))
+        grid.setdefault(key, []).append(node)
+
+    knn = np.zeros((n, k), dtype=np.int32)
+    for node in range(n):
+        cx = int((xs[node] - min_x)/cell_w)
+        cy = int((ys[node] - min_y)/cell_w)
+        ring = 0
+        found = []
+        while True:
+            found.extend(ring_cells(grid, cx, cy, ring))
+            if len(found) > k or ring > cells_per_side:
+                break
+            ring += 1
+        found.extend(ring_cells(grid, cx, cy, ring+1))
+        found = [other for other in found if other != node]
+        found.sort(key=lambda other: (xs[other]-xs[node])**2 + (ys[other]-ys[node])**2)
+        knn[node] = found[:k]
+    return knn
+
+
+def ring_cells(grid, cx, cy, ring):
+    # points in the cells exactly ring steps away from (cx, cy)
+    points = []
+    for gx in range(cx-ring, cx+ring+1):
+        for gy in range(cy-ring, cy+ring+1):
+            if max(abs(gx-cx), abs(gy-cy)) == ring:
+                points.extend(grid.get((gx, gy), []))
+    return points
+
+
+def load_knn(coords, k, cache_dir=CACHE_DIR):
+    # build_knn with a disk cache; one .npy file per instance and k
+    coords = np.ascontiguousarray(coords, dtype=np.float64)
+    key = hashlib.sha1(coords.tobytes()).hexdigest()[:16]
+    path = os.path.join(cache_dir, f"knn_{len(coords)}_{k}_{key}.npy")
+    if os.path.exists(path):
+        return np.load(path)
+    knn = build_knn(coords, k)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # written under a unique name and renamed, so a concurrent reader never sees a partial file
+        tmp_path = f"{path[:-4]}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, knn)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass # the cache is only an optimisation
+    return knn
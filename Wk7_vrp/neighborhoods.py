@@ -0,0 +1,181 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Neighbourhoods for the VRP local search, driven by variable neighbourhood descent (VND).
+# Moves, all on a RouteSet (routes.py):
+#   2-opt     reverse a segment inside one route
+#   relocate  move one customer next to another customer (same or other route)
+#   swap      exchange two customers
+#   2-opt*    exchange the tails of two routes
+#   cross     exchange two segments of up to CROSS_LENGTH customers between two routes
+# Moves are granular: a candidate must create an edge between a customer and one of its k nearest
+# neighbours, so each customer only looks at k candidates. The distance change is priced from the
+# few edges the move replaces; routes are only rebuilt when the move is applied.
+# Every move function applies the first improving candidate it finds for customer u and returns its
+# (negative) change in length, or 0 when there is none.
+
+import time
+
+EPS = 1e-9
+CROSS_LENGTH = 3
+
+
+def two_opt(rs, u, neighbors):
+    dist = rs.dist
+    r, i = rs.route_of[u], rs.pos_of[u]
+    un, up = rs.succ(u), rs.pred(u)
+    for v in neighbors[u]:
+        if rs.route_of[v] != r or v == u:
+            continue
+        j = rs.pos_of[v]
+        # ... u un ... v vn ... -> ... u v ... un vn ...
+        if abs(i - j) > 1:
+            vn = rs.succ(v)
+            delta = dist(u, v) + dist(un, vn) - dist(u, un) - dist(v, vn)
+            if delta < -EPS:
+                rs.reverse(r, min(i, j)+1, max(i, j))
+                return delta
+        # ... up u ... vp v ... -> ... up vp ... u v ...
+        if abs(i - j) > 1:
+            vp = rs.pred(v)
+            delta = dist(u, v) + dist(up, vp) - dist(up, u) - dist(vp, v)
+            if delta < -EPS:
+                rs.reverse(r, min(i, j), max(i, j)-1)
+                return delta
+    return 0
+
+
+def relocate(rs, u, neighbors):
+    dist = rs.dist
+    ru = rs.route_of[u]
+    p, n = rs.pred(u), rs.succ(u)
+    removal = dist(p, n) - dist(p, u) - dist(u, n)
+    for v in neighbors[u]:
+        rv = rs.route_of[v]
+        if rv < 0 or v == u:
+            continue
+        if rv != ru and rs.load[rv] + rs.demand[u] > rs.capacity:
+            continue
+        for after in (True, False):
+            # insert u between a and b, where (a, b) is the edge after or before v
+            a, b = (v, rs.succ(v)) if after else (rs.pred(v), v)
+            if a == u or b == u:
+                continue
+            delta = removal + dist(a, u) + dist(u, b) - dist(a, b)
+            if delta < -EPS:
+                route = rs.routes[ru]
+                route.pop(rs.pos_of[u])
+                target = rs.routes[rv]
+                if rv == ru:
+                    rs.reindex(ru)
+                target.insert(rs.pos_of[v] + (1 if after else 0), u)
+                rs.set_route(ru, route)
+                if rv != ru:
+                    rs.set_route(rv, target)
+                return delta
+    return 0
+
+
+def swap(rs, u, neighbors):
+    for v in neighbors[u]:
+        if rs.route_of[v] < 0 or v == u:
+            continue
+        delta = rs.swap_delta(u, v)
+        if delta < -EPS and rs.swap_fits(u, v):
+            rs.swap(u, v)
+            return delta
+    return 0
+
+
+def two_opt_star(rs, u, neighbors):
+    # route ru = head1 u | un tail1, route rv = head2 vp | v tail2 -> head1 u v tail2 and head2 vp un tail1
+    dist = rs.dist
+    ru, i = rs.route_of[u], rs.pos_of[u]
+    un = rs.succ(u)
+    for v in neighbors[u]:
+        rv = rs.route_of[v]
+        if rv < 0 or rv == ru:
+            continue
+        j = rs.pos_of[v]
+        vp = rs.pred(v)
+        delta = dist(u, v) + dist(vp, un) - dist(u, un) - dist(vp, v)
+        if delta < -EPS:
+            route_u, route_v = rs.routes[ru], rs.routes[rv]
+            head_u = rs.head_load(ru, i+1)
+            head_v = rs.head_load(rv, j)
+            if head_u + rs.load[rv] - head_v > rs.capacity or head_v + rs.load[ru] - head_u > rs.capacity:
+                continue
+            rs.set_route(ru, route_u[:i+1] + route_v[j:])
+            rs.set_route(rv, route_v[:j] + route_u[i+1:])
+            return delta
+    return 0
+
+
+def cross_exchange(rs, u, neighbors, max_length=CROSS_LENGTH):
+    # route ru = .. u [S1] n1 .., route rv = .. vp [S2 starting at v] n2 .. -> the segments trade places,
+    # creating the edge (u, v)
+    dist = rs.dist
+    ru, i = rs.route_of[u], rs.pos_of[u]
+    route_u = rs.routes[ru]
+    if i+1 >= len(route_u):
+        return 0
+    s1_first = route_u[i+1]
+    for v in neighbors[u]:
+        rv = rs.route_of[v]
+        if rv < 0 or rv == ru:
+            continue
+        route_v = rs.routes[rv]
+        j = rs.pos_of[v]
+        vp = rs.pred(v)
+        fixed = dist(u, v) + dist(vp, s1_first) - dist(u, s1_first) - dist(vp, v)
+        for l1 in range(1, max_length+1):
+            if i+l1 >= len(route_u):
+                break
+            s1_last = route_u[i+l1]
+            n1 = route_u[i+l1+1] if i+l1+1 < len(route_u) else rs.depot
+            load1 = rs.segment_load(ru, i+1, i+1+l1)
+            for l2 in range(1, max_length+1):
+                if j+l2 > len(route_v):
+                    break
+                s2_last = route_v[j+l2-1]
+                n2 = route_v[j+l2] if j+l2 < len(route_v) else rs.depot
+                load2 = rs.segment_load(rv, j, j+l2)
+                if rs.load[ru] - load1 + load2 > rs.capacity or rs.load[rv] - load2 + load1 > rs.capacity:
+                    continue
+                delta = (fixed + dist(s2_last, n1) + dist(s1_last, n2)
+                         - dist(s1_last, n1) - dist(s2_last, n2))
+                if delta < -EPS:
+                    s1 = route_u[i+1:i+1+l1]
+                    s2 = route_v[j:j+l2]
+                    rs.set_route(ru, route_u[:i+1] + s2 + route_u[i+1+l1:])
+                    rs.set_route(rv, route_v[:j] + s1 + route_v[j+l2:])
+                    return delta
+    return 0
+
+
+NEIGHBORHOODS = [('2-opt', two_opt), ('relocate', relocate), ('swap', swap), ('2-opt*', two_opt_star), ('cross', cross_exchange)]
+
+
+def vnd(rs, neighbors, deadline=None, verbose=True):
+    # variable neighbourhood descent: sweep the current neighbourhood over every customer, go back to the
+    # first neighbourhood after any improvement and on to the next one otherwise
+    # returns the total change in length; stops at a local optimum of all neighbourhoods or at the deadline
+    customers = [c for c in range(len(rs.route_of)) if rs.route_of[c] >= 0]
+    total = 0
+    level = 0
+    sweeps = 0
+    while level < len(NEIGHBORHOODS):
+        if deadline is not None and time.time() > deadline:
+            break
+        name, move = NEIGHBORHOODS[level]
+        gained = 0
+        for index, u in enumerate(customers):
+            gained += move(rs, u, neighbors)
+            if deadline is not None and index % 64 == 0 and time.time() > deadline:
+                break
+        sweeps += 1
+        total += gained
+        if verbose and gained < 0:
+            print(f"VND sweep {sweeps} ({name}): {round(gained, 2)}")
+        level = 0 if gained < 0 else level + 1
+    return total
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Making tight VRP instances feasible.
+# When there is almost no spare capacity (vrp_31_9_1, vrp_36_11_1) the constructions can leave a
+# route over capacity, and the capacity-respecting moves of neighborhoods.py cannot fix it.
+# repair() moves customers out of overloaded routes, relocating or swapping them. Every step lowers the
+# total excess load and adds the least length per unit of excess removed. When repair gets stuck, a
+# penalised local search (relocate and swap, length + weight * excess, capacity not enforced) moves the
+# solution elsewhere and repair is tried again. The weight starts at about the length per unit of demand
+# and doubles after every sweep that ends infeasible, so early sweeps still trade excess for length and
+# later ones push harder towards feasibility.
+# The excess is kept incrementally by the RouteSet (routes.py); no move re-sums a route load.
+
+import time
+
+from insertion import InsertionCache
+
+EPS = 1e-9
+
+
+def penalized_relocate(rs, u, neighbors, weight):
+    dist = rs.dist
+    ru = rs.route_of[u]
+    d = rs.demand[u]
+    p, n = rs.pred(u), rs.succ(u)
+    removal = dist(p, n) - dist(p, u) - dist(u, n)
+    for v in neighbors[u]:
+        rv = rs.route_of[v]
+        if rv < 0 or v == u or rv == ru:
+            continue
+        excess = rs.excess_change(ru, -d) + rs.excess_change(rv, d)
+        for a, b in ((v, rs.succ(v)), (rs.pred(v), v)):
+            delta = removal + dist(a, u) + dist(u, b) - dist(a, b) + weight*excess
+            if delta < -EPS:
+                rs.remove(u)
+                rs.insert(u, rv, rs.pos_of[b] if b != rs.depot else len(rs.routes[rv]))
+                return delta
+    return 0
+
+
+def penalized_swap(rs, u, neighbors, weight):
+    ru = rs.route_of[u]
+    for v in neighbors[u]:
+        rv = rs.route_of[v]
+        if rv < 0 or v == u or rv == ru:
+            continue
+        diff = rs.demand[v] - rs.demand[u]
+        delta = rs.swap_delta(u, v) + weight*(rs.excess_change(ru, diff) + rs.excess_change(rv, -diff))
+        if delta < -EPS:
+            rs.swap(u, v)
+            return delta
+    return 0
+
+
+def repair(rs, distances):
+    # greedily removes excess load; returns True once the routes are feasible, False when stuck
+    cache = InsertionCache(rs, distances)
+    demand = rs.demand
+    while rs.excess > 0:
+        best = None
+        for r in range(len(rs.routes)):
+            if rs.load[r] <= rs.capacity:
+                continue
+            for c in rs.routes[r]:
+                p, n = rs.pred(c), rs.succ(c)
+                removal = rs.dist(p, n) - rs.dist(p, c) - rs.dist(c, n)
+                for g in range(len(rs.routes)):
+                    if g == r:
+                        continue
+                    # relocate c to g
+                    excess = rs.excess_change(r, -demand[c]) + rs.excess_change(g, demand[c])
+                    if excess < 0:
+                        score = (removal + cache.cost[g, c])/-excess
+                        if best is None or score < best[0]:
+                            best = (score, 'relocate', c, g)
+                    # swap c with a smaller customer of g
+                    for c2 in rs.routes[g]:
+                        diff = demand[c2] - demand[c]
+                        if diff >= 0:
+                            continue
+                        excess = rs.excess_change(r, diff) + rs.excess_change(g, -diff)
+                        if excess < 0:
+                            score = rs.swap_delta(c, c2)/-excess
+                            if best is None or score < best[0]:
+                                best = (score, 'swap', c, c2)
+        if best is None:
+            return False
+        _, kind, c, target = best
+        if kind == 'relocate':
+            cache.remove([c])
+            cache.insert(c, target)
+        else:
+            r, g = rs.route_of[c], rs.route_of[target]
+            rs.swap(c, target)
+            cache.update_route(r)
+            cache.update_route(g)
+    return True
+
+
+def make_feasible(rs, distances, neighbors, deadline=None, max_sweeps=200, verbose=True):
+    # returns True when rs has been made feasible
+    if repair(rs, distances):
+        if verbose:
+            print("Repair: feasible")
+        return True
+    weight = rs.total_length()/max(sum(rs.demand), 1)
+    customers = [c for c in range(len(rs.route_of)) if rs.route_of[c] >= 0]
+    for sweep in range(1, max_sweeps+1):
+        if deadline is not None and time.time() > deadline:
+            break
+        for u in customers:
+            if not penalized_relocate(rs, u, neighbors, weight):
+                penalized_swap(rs, u, neighbors, weight)
+        if verbose:
+            print(f"Penalty sweep {sweep}: length {round(rs.total_length(), 2)}, excess {rs.excess}, weight {round(weight, 3)}")
+        if rs.excess == 0 or repair(rs, distances):
+            if verbose:
+                print("Repair: feasible")
+            return True
+        weight *= 2
+    return False
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Route pool and set-partitioning recombination for the VRP.
+# The pool keeps every distinct feasible route seen during the search with its length, in a dict keyed
+# by the route's customers (a route and its reverse are the same key, distances being symmetric).
+# recombine() then picks the cheapest set of pool routes that serves every customer exactly once with
+# at most vehicle_count vehicles:
+#   min sum length_j x_j   s.t.  sum_{j serves c} x_j = 1 for every customer,  sum x_j <= vehicle_count
+# Uses highspy (HiGHS) when installed, warm-started with the incumbent routes, else scipy.optimize.milp.
+# Without either, a greedy picks disjoint routes by length per customer, regret insertion places the
+# customers left over and VND polishes the result.
+
+import numpy as np
+
+from insertion import InsertionCache, regret_insertion
+from neighborhoods import vnd
+from routes import RouteSet
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+try:
+    from scipy.optimize import Bounds, LinearConstraint, milp
+    from scipy.sparse import csc_matrix
+except ImportError:
+    milp = None
+
+MAX_ROUTES = 20000 # the pool is pruned to half of this when it grows past it
+
+
+def route_key(route):
+    # a route and its reverse have the same length, so they share a key
+    return tuple(route) if route[0] <= route[-1] else tuple(reversed(route))
+
+
+class RoutePool:
+    def __init__(self, capacity, max_routes=MAX_ROUTES):
+        self.capacity = capacity
+        self.max_routes = max_routes
+        self.routes = {} # key -> (length, route)
+
+    def __len__(self):
+        return len(self.routes)
+
+    def add(self, route, length, load):
+        if not route or load > self.capacity:
+            return
+        key = route_key(route)
+        if key not in self.routes:
+            self.routes[key] = (length, list(route))
+            if len(self.routes) > self.max_routes:
+                self.prune()
+
+    def add_solution(self, rs):
+        for r, route in enumerate(rs.routes):
+            self.add(route, rs.route_length(r), rs.load[r])
+
+    def prune(self):
+        # keeps the half of the pool with the lowest length per customer
+        kept = sorted(self.routes.items(), key=lambda item: item[1][0]/len(item[1][1]))[:self.max_routes//2]
+        self.routes = dict(kept)
+
+
+def run_highspy(cost, matrix_start, matrix_index, row_count, vehicle_count, warm, time_limit):
+    col_count = len(cost)
+    h = highspy.Highs()
+    h.setOptionValue('output_flag', False)
+    if time_limit is not None:
+        h.setOptionValue('time_limit', float(time_limit))
+    lp = highspy.HighsLp()
+    lp.num_col_ = col_count
+    lp.num_row_ = row_count
+    lp.col_cost_ = cost
+    lp.col_lower_ = np.zeros(col_count)
+    lp.col_upper_ = np.ones(col_count)
+    lp.row_lower_ = np.concatenate([np.ones(row_count-1), [0]])
+    lp.row_upper_ = np.concatenate([np.ones(row_count-1), [vehicle_count]])
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_ = matrix_start
+    lp.a_matrix_.index_ = matrix_index
+    lp.a_matrix_.value_ = np.ones(len(matrix_index))
+    lp.integrality_ = [highspy.HighsVarType.kInteger]*col_count
+    h.passModel(lp)
+    start = highspy.HighsSolution()
+    start.col_value = warm.tolist()
+    h.setSolution(start)
+    h.run()
+    if h.getInfo().primal_solution_status != 2: # 2 = feasible
+        return None
+    return np.array(h.getSolution().col_value)
+
+
+def run_scipy(cost, matrix_start, matrix_index, row_count, vehicle_count, time_limit):
+    matrix = csc_matrix((np.ones(len(matrix_index)), matrix_index, matrix_start), shape=(row_count, len(cost)))
+    lower = np.concatenate([np.ones(row_count-1), [0]])
+    upper = np.concatenate([np.ones(row_count-1), [vehicle_count]])
+    result = milp(cost, constraints=LinearConstraint(matrix, lower, upper), integrality=np.ones(len(cost)),
+                  bounds=Bounds(0, 1), options={} if time_limit is None else {'time_limit': time_limit})
+    if result.x is None:
+        return None
+    return result.x
+
+
+def greedy_partition(pool, rs_template, distances, neighbors, vehicle_count):
+    # disjoint routes by length per customer, leftovers by regret insertion, then VND
+    chosen = []
+    covered = set()
+    for length, route in sorted(pool.routes.values(), key=lambda item: item[0]/len(item[1])):
+        if len(chosen) == vehicle_count:
+            break
+        if covered.isdisjoint(route):
+            chosen.append(route)
+            covered.update(route)
+    rs = RouteSet(chosen + [[] for v in range(vehicle_count - len(chosen))], distances, rs_template.demand,
+                  rs_template.capacity, rs_template.depot)
+    if not regret_insertion(InsertionCache(rs, distances), 2):
+        return None
+    vnd(rs, neighbors, verbose=False)
+    return rs
+
+
+def recombine(pool, rs, distances, neighbors, time_limit=5, verbose=True):
+    # best combination of pool routes, as a RouteSet with as many routes as rs, or None
+    # rs is the incumbent; its routes are added to the pool and used as the warm start
+    # time_limit: seconds for the MIP solve, None to solve it to optimality
+    pool.add_solution(rs)
+    vehicle_count = len(rs.routes)
+    if highspy is None and milp is None:
+        result = greedy_partition(pool, rs, distances, neighbors, vehicle_count)
+        if verbose and result is not None:
+            print(f"Route pool ({len(pool)} routes, greedy): {round(result.total_length(), 2)}")
+        return result
+
+    entries = list(pool.routes.values())
+    customers = sorted(c for route in rs.routes for c in route)
+    row_of = {c: i for i, c in enumerate(customers)}
+    row_count = len(customers) + 1 # plus the vehicle count row
+    cost = np.array([length for length, _ in entries])
+    matrix_index = []
+    matrix_start = [0]
+    for _, route in entries:
+        matrix_index.extend(row_of[c] for c in route)
+        matrix_index.append(row_count-1)
+        matrix_start.append(len(matrix_index))
+    matrix_index = np.array(matrix_index, dtype=np.int32)
+    matrix_start = np.array(matrix_start, dtype=np.int32)
+    if highspy is not None:
+        incumbent = {route_key(route) for route in rs.routes if route}
+        warm = np.array([1.0 if key in incumbent else 0.0 for key in pool.routes])
+        values = run_highspy(cost, matrix_start, matrix_index, row_count, vehicle_count, warm, time_limit)
+    else:
+        values = run_scipy(cost, matrix_start, matrix_index, row_count, vehicle_count, time_limit)
+    if values is None:
+        return None
+    chosen = [entries[j][1] for j in np.flatnonzero(values > 0.5)]
+    result = RouteSet(chosen + [[] for v in range(vehicle_count - len(chosen))], distances, rs.demand, rs.capacity, rs.depot)
+    if verbose:
+        print(f"Route pool ({len(pool)} routes, {'highspy' if highspy is not None else 'scipy'}): {round(result.total_length(), 2)}")
+    return result
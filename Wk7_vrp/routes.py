@@ -0,0 +1,155 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Route state for the VRP local search.
+# Routes are lists of customer indices (depot excluded, one list per vehicle). route_of[c] and
+# pos_of[c] say where customer c currently sits, so moves look customers up in O(1) instead of
+# walking every tour; every applied move re-indexes only the positions it shifted.
+# The load of every route is kept as well, so a candidate move is priced from the few edges it
+# changes and checked against the capacity without copying or re-summing any route.
+# Per route there are also a cached length and prefix sums of load (so the load of a head or
+# segment, as 2-opt* and CROSS need, is O(1)). Moves only mark the routes they change as
+# dirty; the cache of a dirty route is rebuilt the next time it is read.
+# Loads may exceed the capacity (the penalty search in penalty.py allows it); the total excess load
+# over all routes is kept up to date with every load change.
+# Everything is indexed by customer number (plain int lists, which are the fastest to index from python).
+
+
+class RouteSet:
+    def __init__(self, routes, distances, demands, capacity, depot=0):
+        self.dist = distances.dist
+        self.demand = [int(d) for d in demands]
+        self.capacity = capacity
+        self.depot = depot
+        self.routes = [list(route) for route in routes]
+        self.route_of = [-1]*len(self.demand) # -1 for the depot and unrouted customers
+        self.pos_of = [-1]*len(self.demand)
+        self.load = [sum(self.demand[c] for c in route) for route in self.routes]
+        self.excess = sum(max(load - capacity, 0) for load in self.load)
+        self.length = [0.0]*len(self.routes)
+        self.prefix_load = [None]*len(self.routes) # prefix_load[r][i]: load of the first i customers
+        self.dirty = [True]*len(self.routes)
+        for r in range(len(self.routes)):
+            self.reindex(r)
+
+    def reindex(self, r, start=0):
+        # refreshes route_of/pos_of for route r from position start onwards and marks it dirty
+        route = self.routes[r]
+        for i in range(start, len(route)):
+            self.route_of[route[i]] = r
+            self.pos_of[route[i]] = i
+        self.dirty[r] = True
+
+    def refresh(self, r):
+        # rebuilds the cached length and load prefix sums of route r
+        dist = self.dist
+        prefix_load = [0]
+        length = 0.0
+        prev = self.depot
+        for c in self.routes[r]:
+            prefix_load.append(prefix_load[-1] + self.demand[c])
+            length += dist(prev, c)
+            prev = c
+        self.prefix_load[r] = prefix_load
+        self.length[r] = length + dist(prev, self.depot) if self.routes[r] else 0.0
+        self.dirty[r] = False
+
+    def pred(self, c):
+        i = self.pos_of[c]
+        return self.routes[self.route_of[c]][i-1] if i > 0 else self.depot
+
+    def succ(self, c):
+        route = self.routes[self.route_of[c]]
+        i = self.pos_of[c]
+        return route[i+1] if i+1 < len(route) else self.depot
+
+    def route_length(self, r):
+        if self.dirty[r]:
+            self.refresh(r)
+        return self.length[r]
+
+    def total_length(self):
+        return sum(self.route_length(r) for r in range(len(self.routes)))
+
+    def head_load(self, r, i):
+        # load of the first i customers of route r
+        if self.dirty[r]:
+            self.refresh(r)
+        return self.prefix_load[r][i]
+
+    def segment_load(self, r, i, j):
+        # load of positions i..j-1 of route r
+        if self.dirty[r]:
+            self.refresh(r)
+        return self.prefix_load[r][j] - self.prefix_load[r][i]
+
+    def is_feasible(self):
+        return self.excess == 0
+
+    def excess_change(self, r, amount):
+        # change in the total excess if amount is added to the load of route r
+        load = self.load[r]
+        return max(load + amount - self.capacity, 0) - max(load - self.capacity, 0)
+
+    def change_load(self, r, amount):
+        self.excess += self.excess_change(r, amount)
+        self.load[r] += amount
+
+    def swap_delta(self, c1, c2):
+        # change in total length if c1 and c2 exchange places; only the edges around them change
+        dist = self.dist
+        if self.route_of[c1] == self.route_of[c2] and abs(self.pos_of[c1] - self.pos_of[c2]) == 1:
+            if self.pos_of[c1] > self.pos_of[c2]:
+                c1, c2 = c2, c1
+            a, b = self.pred(c1), self.succ(c2) # a c1 c2 b -> a c2 c1 b
+            return dist(a, c2) + dist(c1, b) - dist(a, c1) - dist(c2, b)
+        p1, n1 = self.pred(c1), self.succ(c1)
+        p2, n2 = self.pred(c2), self.succ(c2)
+        return (dist(p1, c2) + dist(c2, n1) + dist(p2, c1) + dist(c1, n2)
+                - dist(p1, c1) - dist(c1, n1) - dist(p2, c2) - dist(c2, n2))
+
+    def swap_fits(self, c1, c2):
+        r1, r2 = self.route_of[c1], self.route_of[c2]
+        if r1 == r2:
+            return True
+        diff = self.demand[c2] - self.demand[c1]
+        return self.load[r1] + diff <= self.capacity and self.load[r2] - diff <= self.capacity
+
+    def set_route(self, r, route):
+        # replaces route r (used by the moves that rebuild whole routes or tails)
+        self.routes[r] = route
+        self.change_load(r, sum(self.demand[c] for c in route) - self.load[r])
+        self.reindex(r)
+
+    def insert(self, c, r, i):
+        # inserts an unrouted c at position i of route r
+        self.routes[r].insert(i, c)
+        self.change_load(r, self.demand[c])
+        self.reindex(r, i)
+
+    def remove(self, c):
+        # takes c out of its route; it becomes unrouted
+        r, i = self.route_of[c], self.pos_of[c]
+        self.routes[r].pop(i)
+        self.change_load(r, -self.demand[c])
+        self.route_of[c] = self.pos_of[c] = -1
+        self.reindex(r, i)
+
+    def reverse(self, r, i, j):
+        # reverses positions i..j of route r in place; the load is unchanged
+        route = self.routes[r]
+        route[i:j+1] = route[i:j+1][::-1]
+        self.reindex(r, i)
+
+    def swap(self, c1, c2):
+        # exchanges the places of two routed customers
+        r1, i1 = self.route_of[c1], self.pos_of[c1]
+        r2, i2 = self.route_of[c2], self.pos_of[c2]
+        self.routes[r1][i1] = c2
+        self.routes[r2][i2] = c1
+        self.route_of[c1], self.pos_of[c1] = r2, i2
+        self.route_of[c2], self.pos_of[c2] = r1, i1
+        diff = self.demand[c2] - self.demand[c1]
+        self.change_load(r1, diff)
+        self.change_load(r2, -diff)
+        self.dirty[r1] = self.dirty[r2] = True
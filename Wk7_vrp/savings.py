@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Clarke-Wright savings construction for the VRP.
+# Every customer starts on its own depot-c-depot route; joining the routes ending in a and b saves
+#   s(a, b) = d(depot, a) + d(depot, b) - d(a, b)
+# Savings are only computed (in one vectorized pass) for the k nearest neighbour pairs, and are
+# processed largest first from a heap. Routes are tracked with a union-find (route id and load per
+# root) plus the end-to-end links of every customer, so a merge is O(1) and no route is ever copied
+# or reversed during construction. If more routes than vehicles are left, the remaining routes are
+# merged by their best end-to-end saving while the capacity allows it.
+
+import heapq
+
+import numpy as np
+
+
+class RouteUnion:
+    def __init__(self, demands):
+        n = len(demands)
+        self.parent = list(range(n))
+        self.load = list(demands)
+        self.other_end = list(range(n)) # for a route end, the customer at the route's other end
+        self.links = [[] for c in range(n)] # at most two route neighbours per customer
+
+    def find(self, c):
+        while self.parent[c] != c:
+            self.parent[c] = self.parent[self.parent[c]]
+            c = self.parent[c]
+        return c
+
+    def is_end(self, c):
+        return len(self.links[c]) < 2
+
+    def merge(self, a, b):
+        # joins the route ending in a to the route ending in b with the edge (a, b)
+        ra, rb = self.find(a), self.find(b)
+        x, y = self.other_end[a], self.other_end[b]
+        self.parent[rb] = ra
+        self.load[ra] += self.load[rb]
+        self.links[a].append(b)
+        self.links[b].append(a)
+        self.other_end[x] = y
+        self.other_end[y] = x
+
+    def routes(self, customers):
+        # walks every route from one of its ends
+        seen = set()
+        routes = []
+        for c in customers:
+            if c in seen or not self.is_end(c):
+                continue
+            route = [c]
+            seen.add(c)
+            prev, cur = -1, c
+            while True:
+                step = [n for n in self.links[cur] if n != prev]
+                if not step:
+                    break
+                prev, cur = cur, step[0]
+                route.append(cur)
+                seen.add(cur)
+            routes.append(route)
+        return routes
+
+
+def knn_savings(coords, neighbors, depot):
+    # (saving, a, b) for every distinct neighbour pair of customers, as arrays
+    coords = np.asarray(coords, dtype=np.float64)
+    neighbors = np.asarray(neighbors)
+    a = np.repeat(np.arange(len(coords)), neighbors.shape[1])
+    b = neighbors.ravel()
+    pairs = np.unique(np.stack([np.minimum(a, b), np.maximum(a, b)], axis=1), axis=0)
+    pairs = pairs[(pairs[:, 0] != depot) & (pairs[:, 1] != depot) & (pairs[:, 0] != pairs[:, 1])]
+    a, b = pairs[:, 0], pairs[:, 1]
+    to_depot = np.hypot(coords[:, 0] - coords[depot, 0], coords[:, 1] - coords[depot, 1])
+    saving = to_depot[a] + to_depot[b] - np.hypot(coords[a, 0] - coords[b, 0], coords[a, 1] - coords[b, 1])
+    return saving, a, b
+
+
+def clarke_wright(distances, demands, capacity, vehicle_count, neighbors, depot=0):
+    # returns vehicle_count routes (customer index lists, some possibly empty), or None if the routes
+    # could not be merged down to vehicle_count
+    customers = [c for c in range(len(demands)) if c != depot]
+    union = RouteUnion(demands)
+    saving, a, b = knn_savings(distances.coords, neighbors, depot)
+    heap = list(zip((-saving).tolist(), a.tolist(), b.tolist()))
+    heapq.heapify(heap)
+    route_count = len(customers)
+    while heap:
+        s, a, b = heapq.heappop(heap)
+        if s >= 0:
+            break
+        if not (union.is_end(a) and union.is_end(b)):
+            continue
+        ra, rb = union.find(a), union.find(b)
+        if ra != rb and union.load[ra] + union.load[rb] <= capacity:
+            union.merge(a, b)
+            route_count -= 1
+
+    while route_count > vehicle_count:
+        # best remaining merge over all pairs of route ends (few routes are left at this point)
+        ends = sorted({e for c in customers if union.is_end(c) for e in (c, union.other_end[c])})
+        best = None
+        for i, a in enumerate(ends):
+            for b in ends[i+1:]:
+                ra, rb = union.find(a), union.find(b)
+                if ra == rb or union.load[ra] + union.load[rb] > capacity:
+                    continue
+                s = distances.dist(depot, a) + distances.dist(depot, b) - distances.dist(a, b)
+                if best is None or s > best[0]:
+                    best = (s, a, b)
+        if best is None:
+            return None
+        union.merge(best[1], best[2])
+        route_count -= 1
+
+    routes = union.routes(customers)
+    return routes + [[] for v in range(vehicle_count - len(routes))]
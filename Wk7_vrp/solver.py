@@ -1,82 +1,88 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import math
-from collections import namedtuple
-
-Customer = namedtuple("Customer", ['index', 'demand', 'x', 'y'])
-
-def length(c1, c2):
-    return math.sqrt((c1.x - c2.x)**2 + (c1.y - c2.y)**2)
-
-def build_dist_from_depot(customers, depot):
-    # only called once
-    dist = []
-    for c in customers:
-        dist.append(round(length(c,depot),3))
-    return dist
-
-def get_dist_of_tour(depot,tour):
-    # tour is passed as a list of customers not including the depot
-    dist = 0
-    if len(tour) > 0:
-        dist += length(depot,tour[0])
-        for i in range(0, len(tour)-1):
-            dist += length(tour[i],tour[i+1])
-        dist += length(tour[-1],depot)
-    return dist
-
-def get_next_c(remaining_customers, depot, cap_remaining):
+import time
+import numpy as np
+from alns import RECOMBINE_TIME, alns
+from distances import DistanceProvider
+from insertion import InsertionCache, regret_insertion
+from islands import run_islands
+from knn import load_knn
+from neighborhoods import vnd
+from penalty import make_feasible
+from route_pool import RoutePool, recombine
+from routes import RouteSet
+from savings import clarke_wright
+
+def get_next_c(remaining_customers, demands, dist_from_depot, cap_remaining):
     # this should return the 'apogee' or the farthest unassigned node from the depot
     # problem: some cases do not have any spare trucks. this means that a scenario can happen where no trucks can accomodate a large leftover item.
     # we can try a distance-demand product to fix this
+    # remaining_customers is a list of customer indices; demands and dist_from_depot are arrays over all customers
     
-    max_demand = max([c.demand for c in remaining_customers])
-    if max_demand * 2 > max(cap_remaining):
-        order = sorted(remaining_customers, key=lambda customer: -customer.demand)
-        return order[0]
+    remaining = np.asarray(remaining_customers)
+    remaining_demand = demands[remaining]
+    if remaining_demand.max() * 2 > max(cap_remaining):
+        return int(remaining[np.argmax(remaining_demand)])
     
-    cust = remaining_customers[0]
-    max_score = 0
-    for c in remaining_customers:
-        score = c.demand * length(depot, c)
-        if score > max_score:
-            max_score = score
-            cust = c
-    return cust
-
-def isvalid(customers, v_tours, v_capacity):
-    # returns 1 if no vehicle is over capacity, 0 otherwise
-    for tour in v_tours:
-        if sum([c.demand for c in tour]) > v_capacity and sum([len(v) for v in v_tours]) == len(customers) - 1:
-            return 0
-    return 1
-
-def loc_of_customer(v_tours, customer):
-    # returns the vehicle and index of a customer, if it is assigned
-    # returns -1 otherwise
-    for vehicle, tour in enumerate(v_tours):
-        for index, c in enumerate(tour):
-            if c == customer:
-                return vehicle, index
-    return -1, -1
-
-
-def get_obj_value(depot,vehicle_tours,vehicle_count):
-    # whatever
-    obj = 0
-    for tour in vehicle_tours:
-        obj += get_dist_of_tour(depot,tour)
-    return obj
-
-def print_full_tour_list(v_tours, depot):
-    for tour in v_tours:
-        tour_customers = [c.index for c in tour]
-        tour_demand = sum([c.demand for c in tour])
-        print(round(get_dist_of_tour(depot,tour),3), tour_demand, tour_customers)
-
-def solve_it(input_data):
+    score = remaining_demand * dist_from_depot[remaining]
+    if score.max() > 0:
+        return int(remaining[np.argmax(score)])
+    return int(remaining[0])
+
+
+def demand_order_insertion(demands, dist_from_depot, cache):
+    # inserts the customers in get_next_c order (largest demands first on tight instances), each into the
+    # vehicle whose tour comes out shortest; a vehicle without room is only used when none has room
+    # tour lengths and insertion positions come from the insertion cache instead of rebuilding test tours
+    route_set = cache.rs
+    remaining_customers = np.flatnonzero(cache.unrouted).tolist()
+    cap_remaining = [route_set.capacity - load for load in route_set.load]
+    while len(remaining_customers) > 0:
+        c = get_next_c(remaining_customers, demands, dist_from_depot, cap_remaining)
+        test_dist = cache.length + cache.feasible_costs()[:, c]
+        # defaults to the vehicle with the most room left
+        best_v = int(np.argmin(test_dist)) if np.isfinite(test_dist).any() else cap_remaining.index(max(cap_remaining))
+        remaining_customers.remove(c)
+        cache.insert(c, best_v)
+        cap_remaining[best_v] -= demands[c]
+
+def swap_search(route_set, verbose=True):
+    # for every pair of customers, swap them if that is shorter and the capacities hold
+    # swaps are priced from the edges around the two customers and checked against the route loads
+    # kept by the route set (see routes.py); only accepted swaps touch the routes
+    customer_count = len(route_set.route_of)
+    attempt = 0
+    while True:
+        attempt += 1
+        if verbose:
+            print(f"Attempt: {attempt}")
+        no_improvement = True
+        for i in range(1,customer_count-1):
+            for k in range(i+1,customer_count):
+                delta = route_set.swap_delta(i, k)
+                if delta < -1e-9 and route_set.swap_fits(i, k):
+                    route_set.swap(i, k)
+                    no_improvement = False
+        if no_improvement:
+            break
+
+def print_full_tour_list(route_set):
+    # length, load and customers of every route, from the route set's caches
+    for r, route in enumerate(route_set.routes):
+        print(round(route_set.route_length(r),3), route_set.load[r], route)
+
+def solve_it(input_data, time_limit=None, k=10, use_alns=None, seed=0, processes=None):
     # Modify this code to run your optimization algorithm
+    # time_limit: wall-clock seconds for the whole run; the neighbourhood descent (neighborhoods.py) stops
+    # there, and runs to a local optimum without a limit
+    # k: moves only link a customer to one of its k nearest neighbours
+    # use_alns: spend the time left after the constructions on ALNS (alns.py), seeded with seed;
+    # defaults to on when there is a time_limit
+    # processes: run ALNS as an island model on this many processes (islands.py) instead of on one core
+    start_time = time.time()
+    if use_alns is None:
+        use_alns = time_limit is not None
 
     # parse the input
     lines = input_data.split('\n')
@@ -86,43 +92,43 @@ def solve_it(input_data):
     vehicle_count = int(parts[1])
     vehicle_capacity = int(parts[2])
     
-    customers = []
-    for i in range(1, customer_count+1):
-        line = lines[i]
-        parts = line.split()
-        customers.append(Customer(i-1, int(parts[0]), float(parts[1]), float(parts[2])))
+    # one array per attribute, indexed by customer
+    rows = np.array([lines[i].split()[:3] for i in range(1, customer_count+1)], dtype=np.float64).reshape(-1, 3)
+    demands = rows[:, 0].astype(np.int64)
+    xs, ys = rows[:, 1], rows[:, 2]
 
     #the depot is always the first customer in the input
-    depot = customers[0]
+    depot = 0
     print(f"Customers: {customer_count}, Vehicles: {vehicle_count}, Capacity: {vehicle_capacity}")
-    max_demand = max([c.demand for c in customers])
+    max_demand = demands.max()
     print(f"Largest Demand: {max_demand}")
-    print(f"Depot: {depot.x}, {depot.y}")
+    print(f"Depot: {xs[depot]}, {ys[depot]}")
+    distances = DistanceProvider(rows[:, 1:])
+    dist_from_depot = np.hypot(xs - xs[depot], ys - ys[depot])
 
     # build a trivial solution
     # assign customers to vehicles starting by the largest customer demands
     vehicle_tours = []
     
-    remaining_customers = set(customers)
-    remaining_customers.remove(depot)
+    remaining_customers = set(range(1, customer_count))
     
     for v in range(0, vehicle_count):
         # print "Start Vehicle: ",v
         vehicle_tours.append([])
         cap_remaining = vehicle_capacity
-        while sum([cap_remaining >= customer.demand for customer in remaining_customers]) > 0:
+        while sum([cap_remaining >= demands[c] for c in remaining_customers]) > 0:
             used = set()
-            order = sorted(remaining_customers, key=lambda customer: -customer.demand)
-            for customer in order:
-                if cap_remaining >= customer.demand:
-                    cap_remaining -= customer.demand
-                    vehicle_tours[v].append(customer)
+            order = sorted(remaining_customers, key=lambda c: -demands[c])
+            for c in order:
+                if cap_remaining >= demands[c]:
+                    cap_remaining -= demands[c]
+                    vehicle_tours[v].append(c)
                     # print '   add', ci, cap_remaining
-                    used.add(customer)
+                    used.add(c)
             remaining_customers -= used
 
     # checks that the number of customers served is correct
-    assert sum([len(v) for v in vehicle_tours]) == len(customers) - 1
+    assert sum([len(v) for v in vehicle_tours]) == customer_count - 1
 
 # CP/LS Method
 # We are trying to avoid using MIP because it's annoying
@@ -139,97 +145,89 @@ def solve_it(input_data):
 # 5. (200_16) 1881 > 1400
 # 6. (421_41) 2236 > 2000
 
-    v_tours_ls = [ [] for i in range(vehicle_count)]
-    remaining_customers = list(customers)
-    remaining_customers.remove(depot)
-    cap_remaining = [vehicle_capacity]*vehicle_count
-    dist_from_depot = build_dist_from_depot(customers, depot)
-
-    while len(remaining_customers) > 0:
-        c = get_next_c(remaining_customers, depot, cap_remaining)
-        # this currently returns the highest-demand customer
-        # we can also try adding a check to the above so that if there is one-and-only-one v that fits the maximum c, then return that c, and otherwise go with a more optimal c
-        best_dist = float('inf')
-        best_v = cap_remaining.index(max(cap_remaining))
-        # defaults to the vehicle with the most room left
-        best_i = 0
-        # try all possible assignments and go with the one that adds the least distance
-        for vehicle, tour in enumerate(v_tours_ls):
-            if cap_remaining[vehicle] >= c.demand:
-                test_tour = list(tour)
-                for i in range(len(test_tour) + 1):
-                    test_tour.insert(i,c)
-                    test_dist = get_dist_of_tour(depot, test_tour)
-                    if test_dist < best_dist:
-                        best_v = vehicle
-                        best_i = i
-                        best_dist = test_dist
-                    test_tour.remove(c)
-        remaining_customers.remove(c)
-        v_tours_ls[best_v].insert(best_i,c)
-        cap_remaining[best_v] -= c.demand
-    
-    print("Initial Solution:")
-    print_full_tour_list(v_tours_ls, depot)
-    obj = get_obj_value(depot, v_tours_ls, vehicle_count)
-    print("Capacities Remaining:")
-    print(cap_remaining)
-
-
-    print("Starting Local Search...")
-    # TO DO: Add LS
-    # method:
-    # for each v:
-    #   for each c in v:
-    #       test_case = that c swapped with every other node in the set
-    #       if test_case < best_case and capacities are valid:
-    #           keep the solution
-    # the number of swaps should be roughly quadratic, or about 180K for the largest case
-    # since each customer is guaranteed assigned, we can access and swap them in order, even though they are almost certainly out of order in the solution
-
-    current_best_obj = obj
-    attempt = 0
-    while True:
-        attempt += 1
-        print(f"Attempt: {attempt}")
-        print(f"Current Best Obj. Value: {current_best_obj}")
-        no_improvement = True
-        for i in range(1,len(customers)-1):
-            for k in range(i+1,len(customers)):
-                test_v_tours = []
-                for tour in v_tours_ls:
-                    test_v_tours.append(list(tour))
-                
-                c1 = customers[i]
-                c2 = customers[k]
-                c1v, c1i = loc_of_customer(test_v_tours, c1)
-                c2v, c2i = loc_of_customer(test_v_tours, c2)
-                test_v_tours[c1v][c1i] = c2
-                test_v_tours[c2v][c2i] = c1
-                test_obj = get_obj_value(depot, test_v_tours, vehicle_count)
-                
-                if test_obj < current_best_obj and isvalid(customers, test_v_tours, vehicle_capacity):
-                    v_tours_ls = list(test_v_tours)
-                    current_best_obj = test_obj
-                    no_improvement = False
-        if no_improvement:
-            break
+    # constructions: Clarke-Wright savings (savings.py) and regret-2 insertion (insertion.py) when they fit
+    # in vehicle_count vehicles, and the original largest-demand-first insertion, which also handles the
+    # tight instances; each one is improved and the best is kept
+    # the routes of every improved construction, and those ALNS accepts, go into a route pool
+    # (route_pool.py) whose best set partition is tried at the end
+    neighbors = load_knn(distances.coords, k).tolist()
+    pool = RoutePool(vehicle_capacity)
+    constructions = []
+    savings_routes = clarke_wright(distances, demands, vehicle_capacity, vehicle_count, neighbors, depot)
+    if savings_routes is not None:
+        constructions.append(("Clarke-Wright savings", savings_routes))
+    # insertion costs are cached per route and only the route that changed is recomputed
+    route_set = RouteSet([[] for v in range(vehicle_count)], distances, demands, vehicle_capacity, depot)
+    if regret_insertion(InsertionCache(route_set, distances), 2):
+        constructions.append(("regret-2 insertion", route_set.routes))
+    route_set = RouteSet([[] for v in range(vehicle_count)], distances, demands, vehicle_capacity, depot)
+    demand_order_insertion(demands, dist_from_depot, InsertionCache(route_set, distances))
+    constructions.append(("largest demand first insertion", route_set.routes))
+
+    best = None
+    for index, (name, routes) in enumerate(constructions):
+        route_set = RouteSet(routes, distances, demands, vehicle_capacity, depot)
+        obj = route_set.total_length()
+        print(f"Initial Solution ({name}):")
+        print_full_tour_list(route_set)
+        print("Capacities Remaining:")
+        print([vehicle_capacity - load for load in route_set.load])
+
+        deadline = None
+        if time_limit is not None:
+            # the constructions left share the remaining time, or a fifth of the limit when ALNS follows
+            budget = 0.2*time_limit if use_alns else time_limit
+            deadline = time.time() + max(start_time + budget - time.time(), 0)/(len(constructions) - index)
+        if not route_set.is_feasible():
+            # tight instance: repair the overloaded routes, with a penalised search if needed (penalty.py)
+            print(f"Repairing: excess load {route_set.excess}")
+            make_feasible(route_set, distances, neighbors, deadline)
+        print("Starting Local Search...")
+        swap_search(route_set)
+        print("Starting Neighbourhood Descent...")
+        vnd(route_set, neighbors, deadline)
+
+        current_best_obj = route_set.total_length()
+        feasible = route_set.is_feasible()
+        pool.add_solution(route_set)
+        print(f"Obj. Value before Local Search: {round(obj, 2)}")
+        print(f"Obj. Value after Local Search: {round(current_best_obj, 2)}{'' if feasible else ' (over capacity)'}")
+        if best is None or (feasible, -current_best_obj) > (best[0], -best[1]):
+            best = (feasible, current_best_obj, [list(route) for route in route_set.routes])
 
     print("Local Search Finished.")
-    print(f"Obj. Value before Local Search: {round(obj, 2)}")
-    print(f"Obj. Value after Local Search: {round(current_best_obj, 2)}")
-    if isvalid(customers, v_tours_ls, vehicle_capacity):
+    # time kept back for the final route pool solve
+    reserve = 0 if time_limit is None else min(RECOMBINE_TIME, 0.1*time_limit)
+    if use_alns and best[0] and time_limit is not None and start_time + time_limit - reserve - time.time() > 1:
+        if processes is not None and processes > 1:
+            routes, length, history = run_islands(distances.coords, demands, vehicle_capacity, best[2],
+                                                  start_time + time_limit - reserve - time.time(), processes, depot, seed, k)
+        else:
+            route_set = RouteSet(best[2], distances, demands, vehicle_capacity, depot)
+            routes, length, history = alns(route_set, distances, neighbors, start_time + time_limit - reserve - time.time(),
+                                           seed=seed, pool=pool)
+            print(f"ALNS improvements: {len(history) - 1}")
+        if length < best[1]:
+            best = (True, length, routes)
+    if best[0]:
+        route_set = RouteSet(best[2], distances, demands, vehicle_capacity, depot)
+        recombine_time = None if time_limit is None else max(start_time + time_limit - time.time(), 0.1)
+        combined = recombine(pool, route_set, distances, neighbors, recombine_time)
+        if combined is not None and combined.total_length() < best[1] - 1e-9:
+            vnd(combined, neighbors, verbose=False)
+            best = (True, combined.total_length(), [list(route) for route in combined.routes])
+    route_set = RouteSet(best[2], distances, demands, vehicle_capacity, depot)
+    if route_set.is_feasible():
         print("Solution Found:")
-    
 
     # calculate the cost of the solution; for each vehicle the length of the route
-    vehicle_tours = v_tours_ls
-    obj = get_obj_value(depot,vehicle_tours,vehicle_count)
+    vehicle_tours = route_set.routes
+    obj = route_set.total_length()
 
     # prepare the solution in the specified output format
     outputData = '%.2f' % obj + ' ' + str(0) + '\n'
     for v in range(0, vehicle_count):
-        outputData += str(depot.index) + ' ' + ' '.join([str(customer.index) for customer in vehicle_tours[v]]) + ' ' + str(depot.index) + '\n'
+        outputData += str(depot) + ' ' + ' '.join([str(c) for c in vehicle_tours[v]]) + ' ' + str(depot) + '\n'
 
     return outputData
 
@@ -242,8 +240,10 @@ if __name__ == '__main__':
         file_location = sys.argv[1].strip()
         with open(file_location, 'r') as input_data_file:
             input_data = input_data_file.read()
-        print(solve_it(input_data))
+        time_limit = float(sys.argv[2]) if len(sys.argv) > 2 else None
+        processes = int(sys.argv[3]) if len(sys.argv) > 3 else None
+        print(solve_it(input_data, time_limit, processes=processes))
     else:
 
-        print('This test requires an input file.  Please select one from the data directory. (i.e. python solver.py ./data/vrp_5_4_1)')
+        print('This test requires an input file.  Please select one from the data directory. (i.e. python solver.py ./data/vrp_5_4_1 [seconds] [processes])')
 